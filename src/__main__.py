@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Nov 17 10:12:36 2022
+
+@author: fatima-zahrabanani
+
+Command line interface of the workflow.
+
+    python -m src clean --workers 4
+    python -m src clean --engine polars
+    python -m src features
+    python -m src train --search halving
+    python -m src train --out-of-core --baseline
+    python -m src predict projects.csv --output predictions.csv
+    python -m src report
+    python -m src startup
+
+Each command only imports the modules it runs (see COMMAND_MODULES),
+the startup command checks the import time of clean and predict.
+"""
+import argparse
+import json
+import os
+import sys
+
+# modules imported by each command
+COMMAND_MODULES = {"clean": ["src.pipeline", "src.data.make_dataset"],
+                   "features": ["src.pipeline", "src.features.build_features"],
+                   "train": ["src.pipeline", "src.models.train_model"],
+                   "predict": ["src.models.predict_model"],
+                   "report": ["src.data.storage", "src.visualizations.visualize"]}
+
+# heavy modules that a command must not import
+FORBIDDEN_MODULES = {"clean": ["sklearn", "matplotlib", "seaborn", "plotly", "shap", "bs4", "polars"],
+                     "predict": ["sklearn", "matplotlib", "seaborn", "plotly", "shap", "bs4", "pycountry", "polars"]}
+
+# default import budget of the commands, in seconds
+IMPORT_BUDGETS = {"clean": 1.5, "predict": 1.5}
+
+# figures of the report: (plot type, column[, parameters])
+REPORT_JOBS = [("univariate", "main_category"), ("univariate", "country"), ("univariate", "campaign_period"),
+               ("box", "backers"), ("box", "campaign_period"),
+               ("bivariate", "main_category"), ("bivariate", "country"), ("bivariate", "campaign_period", {"nbins": 10})]
+
+
+def default_project_dir():
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def make_pipeline(args, **params):
+    from src.pipeline import Pipeline
+    from src.data.storage import Storage
+    exchange_rates = None
+    if getattr(args, "offline", False):
+        from src.data.exchange_rates import ExchangeRates
+        exchange_rates = ExchangeRates(args.project_dir, source = None)
+    return Pipeline(args.project_dir, storage = Storage(args.project_dir, args.storage),
+                    exchange_rates = exchange_rates, instrumentation = args.instrument, **params)
+
+
+def clean(args):
+    params = {"workers": args.workers, "typed": args.typed}
+    if args.engine != "pandas":
+        params["engine"] = args.engine
+    if args.chunksize != None:
+        params["chunksize"] = args.chunksize
+    pipeline = make_pipeline(args, clean_params = params)
+    print(pipeline.run(stages = ["clean"], force = args.force))
+
+
+def features(args):
+    pipeline = make_pipeline(args, features_params = {"outliers": args.outliers})
+    print(pipeline.run(stages = ["features"], force = args.force))
+
+
+def train(args):
+    params = {"search": args.search}
+    if args.out_of_core:
+        params.update({"out_of_core": True, "chunksize": args.chunksize, "baseline": args.baseline})
+    pipeline = make_pipeline(args, train_params = params)
+    print(pipeline.run(stages = ["train"], force = args.force))
+
+
+def predict(args):
+    import pandas as pd
+    from src.models.predict_model import Predict
+    from src.instrumentation import instrument
+    projects = pd.read_csv(args.input)
+    # the model is loaded once for the whole file, its hash is checked
+    predictor = Predict(args.project_dir, None, args.features, args.target, verify = True)
+    if args.instrument != None:
+        with instrument(args.instrument):
+            projects[args.target] = predictor.predict(projects)
+    else:
+        projects[args.target] = predictor.predict(projects)
+
+    if args.output != None:
+        projects.to_csv(args.output, index=False)
+        print("{} predictions written to {}".format(len(projects), args.output))
+    else:
+        projects.to_csv(sys.stdout, index=False)
+
+
+def report(args):
+    from src.data.storage import Storage
+    from src.visualizations.visualize import Visualize
+    df = Storage(args.project_dir, args.storage).read("clean")
+    visualize = Visualize(df, args.project_dir, show = False)
+    status = visualize.render_report(REPORT_JOBS, workers = args.workers, force = args.force)
+    for imageFile, state in status.items():
+        print(state, os.path.relpath(imageFile, args.project_dir))
+    if "failed" in status.values():
+        sys.exit(1)
+
+
+def measure_import(command, python = sys.executable):
+    """
+    function which imports the modules of a command in a new interpreter.
+
+    Returns
+    -------
+    (seconds, list of the imported top-level packages)
+
+    """
+    import subprocess
+    code = ("import time, sys, json; start = time.perf_counter()\n"
+            "for module in {!r}: __import__(module)\n"
+            "print(json.dumps([time.perf_counter() - start, sorted({{name.split('.')[0] for name in sys.modules}})]))").format(COMMAND_MODULES[command])
+    output = subprocess.run([python, "-c", code], cwd=default_project_dir(), capture_output=True, text=True, check=True).stdout
+    seconds, packages = json.loads(output.strip().splitlines()[-1])
+    return seconds, packages
+
+
+def startup(args):
+    """
+    function which checks that the imports of clean and predict stay under
+    their budget (median of several new interpreters) and don't load the
+    heavy modules they don't need. Exits with 1 otherwise.
+    """
+    failed = False
+    for command in ["clean", "predict"]:
+        times = []
+        for _ in range(args.repeat):
+            seconds, packages = measure_import(command)
+            times.append(seconds)
+        median = sorted(times)[len(times)//2]
+        budget = args.budget if args.budget != None else IMPORT_BUDGETS[command]
+        forbidden = [module for module in FORBIDDEN_MODULES[command] if module in packages]
+        ok = median <= budget and len(forbidden) == 0
+        failed = failed or not ok
+        print("{:<8} imports {:.3f}s (budget {:.2f}s){} {}".format(command, median, budget,
+              ", loads " + ", ".join(forbidden) if len(forbidden) > 0 else "", "OK" if ok else "FAILED"))
+    if failed:
+        sys.exit(1)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="python -m src", description="Kickstarter projects workflow")
+    parser.add_argument("--project-dir", default=default_project_dir())
+    parser.add_argument("--storage", default="csv", choices=["csv", "parquet", "feather"], help="format of the clean and processed datasets")
+    parser.add_argument("--instrument", help="json lines file receiving the instrumentation records")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("clean", help="clean data/original.csv")
+    command.add_argument("--workers", type=int, default=1)
+    command.add_argument("--chunksize", type=int, help="clean the dataset by chunks of rows")
+    command.add_argument("--typed", action="store_true", help="read the original dataset with its schema types")
+    command.add_argument("--engine", default="pandas", choices=["pandas", "polars"], help="engine of the cleaning steps")
+    command.add_argument("--offline", action="store_true", help="don't import missing exchange rates")
+    command.add_argument("--force", action="store_true", help="run even if the outputs are up to date")
+    command.set_defaults(function=clean)
+
+    command = commands.add_parser("features", help="build the processed dataset")
+    command.add_argument("--outliers", nargs="*", default=["backers"], help="columns whose outliers are dropped")
+    command.add_argument("--force", action="store_true")
+    command.set_defaults(function=features)
+
+    command = commands.add_parser("train", help="train the decision tree")
+    command.add_argument("--search", default="grid", choices=["grid", "halving"])
+    command.add_argument("--out-of-core", action="store_true", help="train from histograms of the processed dataset read by chunks")
+    command.add_argument("--chunksize", type=int, default=100000, help="rows per chunk of the out-of-core training")
+    command.add_argument("--baseline", action="store_true", help="compare the out-of-core tree with the in-memory one")
+    command.add_argument("--force", action="store_true")
+    command.set_defaults(function=train)
+
+    command = commands.add_parser("predict", help="predict the state of the projects of a csvFile")
+    command.add_argument("input", help="csvFile of projects with the features columns")
+    command.add_argument("--output", help="written csvFile, the standard output by default")
+    command.add_argument("--features", nargs="+", default=["main_category","goal","currency","campaign_period"])
+    command.add_argument("--target", default="state")
+    command.set_defaults(function=predict)
+
+    command = commands.add_parser("report", help="render the figures of the report")
+    command.add_argument("--workers", type=int)
+    command.add_argument("--force", action="store_true")
+    command.set_defaults(function=report)
+
+    command = commands.add_parser("startup", help="check the import time of clean and predict")
+    command.add_argument("--repeat", type=int, default=5)
+    command.add_argument("--budget", type=float, help="budget in seconds of both commands")
+    command.set_defaults(function=startup)
+    return parser
+
+
+def main(argv = None):
+    args = make_parser().parse_args(argv)
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
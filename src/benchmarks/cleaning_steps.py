@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 27 14:03:52 2022
+
+@author: fatima-zahrabanani
+
+Benchmark of the column-wide remove_advanced_anomaly and fill_nans
+against their previous row-wise (DataFrame.apply) versions.
+
+    python -m src.benchmarks.cleaning_steps --rows 1000000
+"""
+from src.data.make_dataset import MakeDataset
+from src.data.exchange_rates import ExchangeRates, FixedRates
+import pandas as pd
+import numpy as np
+import argparse
+import tempfile
+import time
+import os
+
+
+def legacy_remove_advanced_anomaly(df, main_sub_categories):
+    """
+    previous version of MakeDataset.remove_advanced_anomaly (row-wise category fix).
+    """
+    df['campaign_period'] = (df['deadline'] - df['launched']).dt.total_seconds()
+    df = df[df['campaign_period']<= (60*24*60*60)].copy()
+    df['campaign_period'] = df['campaign_period']//86400
+    df['category'] = df.apply(lambda x: x.category if x.category in main_sub_categories[x.main_category] else 
+                              x.main_category, axis=1)
+    return df
+
+
+def legacy_fill_nans(df, rates):
+    """
+    previous version of MakeDataset.fill_nans (one conversion per row).
+    """
+    df['usd_pledged'] = df.apply(lambda row: rates.get_rate(row["currency"],'USD',row["deadline"])*row["pledged"] 
+                                 if np.isnan(row['usd_pledged']) else row['usd_pledged'], axis=1)
+    df['state'] = df.apply(lambda row: "successful" if (row['goal'] <= row['pledged']) else "failed", axis=1)
+    return df
+
+
+def make_frame(makeData, n_rows, seed = 0):
+    """
+    function which creates a dataFrame with the columns used by 
+    remove_advanced_anomaly and fill_nans, as they are after remove_basic_anomaly.
+    """
+    rng = np.random.default_rng(seed)
+    main_categories = makeData.select_allowed_options("main_category")
+    categories = makeData.select_allowed_options("category")
+    all_categories = [item for sublist in categories for item in sublist]
+    
+    main_index = rng.integers(0, len(main_categories), n_rows)
+    launched = pd.Timestamp("2012-01-01") + pd.to_timedelta(rng.integers(0, 4*365*86400, n_rows), unit="s")
+    goal = np.round(rng.lognormal(8.5, 1.2, n_rows))
+    pledged = np.round(goal*rng.lognormal(-0.5, 1, n_rows), 2)
+    usd_pledged = np.where(rng.random(n_rows) < 0.1, np.nan, pledged)
+    return pd.DataFrame({
+        "category": np.array(all_categories, dtype=object)[rng.integers(0, len(all_categories), n_rows)],
+        "main_category": np.array(main_categories, dtype=object)[main_index],
+        "currency": np.array(makeData.select_allowed_options("currency"), dtype=object)[rng.integers(0, 15, n_rows)],
+        "deadline": launched + pd.to_timedelta(rng.integers(86400, 75*86400, n_rows), unit="s"),
+        "goal": goal,
+        "launched": launched,
+        "pledged": pledged,
+        "usd_pledged": usd_pledged})
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the column-wide cleaning steps against their row-wise versions")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--project-dir", default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    args = parser.parse_args()
+    
+    # no dataset is loaded by MakeDataset in streaming mode
+    makeData = MakeDataset(args.project_dir, chunksize = args.rows)
+    df = make_frame(makeData, args.rows)
+    main_categories = makeData.select_allowed_options("main_category")
+    categories = makeData.select_allowed_options("category")
+    main_sub_categories = {main_categories[i]: categories[i]+[main_categories[i]] for i in range(len(main_categories))}
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rates = FixedRates({"USD": 1.0}, default = 1.1)
+        makeData.exchange_rates = ExchangeRates(tmp_dir, source = rates)
+        
+        legacy, legacy_advanced = timed(legacy_remove_advanced_anomaly, df.copy(), main_sub_categories)
+        makeData.df = df.copy()
+        _, advanced = timed(makeData.remove_advanced_anomaly)
+        
+        legacy, legacy_fill = timed(legacy_fill_nans, legacy, rates)
+        _, fill = timed(makeData.fill_nans)
+    
+    # both versions must give the same output
+    pd.testing.assert_frame_equal(makeData.df.astype({"state": object}), legacy.astype({"state": object}))
+    
+    print("rows:", args.rows)
+    for step, legacy_time, new_time in [("remove_advanced_anomaly", legacy_advanced, advanced), ("fill_nans", legacy_fill, fill)]:
+        print("{}: row-wise {:.2f}s, column-wide {:.2f}s, speedup x{:.1f}".format(step, legacy_time, new_time, legacy_time/new_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Nov 22 15:06:38 2022
+
+@author: fatima-zahrabanani
+
+Benchmark of the parallel cross-validation of the hyperparameter search:
+wall time and peak memory of the process and its workers, for several
+worker counts, when each worker receives its own copy of the training data
+(copy) and when the workers memory-map one SharedDataset (shared).
+
+    python -m src.benchmarks.cv_workers --rows 1000000 --workers 1 2 4 8
+
+The memory is the proportional set size (Pss) summed over the process and
+its children: a page shared by n processes counts 1/n in each of them,
+so the shared matrix is only counted once.
+"""
+from src.instrumentation import PeakRss
+from src.models.hyperparameter_search import GridSearch
+from src.benchmarks.stages import git_commit, FEATURES, TARGET
+from src.data.storage import Storage
+from sklearn.tree import DecisionTreeClassifier
+import numpy as np
+import datetime
+import platform
+import argparse
+import json
+import time
+import os
+
+# grid of Train.hyperparameter_tuning_training
+PARAM_GRID = {'max_depth': [2, 3], 'min_samples_leaf': [3, 5, 7], 'criterion': ["gini", "entropy"]}
+
+
+def children(pid):
+    # pids of the descendants of a process
+    parents = dict()
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open("/proc/{}/stat".format(entry), 'r') as stat:
+                    # the command name may contain spaces, the fields after it don't
+                    parents[int(entry)] = int(stat.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+    descendants, queue = [], [pid]
+    while queue:
+        parent = queue.pop()
+        found = [child for child, ppid in parents.items() if ppid == parent]
+        descendants += found
+        queue += found
+    return descendants
+
+
+def pss(pid):
+    # proportional set size of a process in bytes, 0 if it exited
+    try:
+        with open("/proc/{}/smaps_rollup".format(pid), 'r') as rollup:
+            for line in rollup:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    return 0
+
+
+class PeakTreePss(PeakRss):
+    """
+    context manager sampling the memory of the process and of its
+    workers (sum of their Pss) to get its peak.
+    """
+    def __init__(self, interval = 0.02):
+        super().__init__(interval)
+
+    def sample(self):
+        pid = os.getpid()
+        total = sum(pss(process) for process in [pid] + children(pid))
+        self.peak = total if self.peak == None else max(self.peak, total)
+
+
+def training_data(project_dir, n_rows = None, seed = 0):
+    """
+    function which returns the features and the target of the processed
+    dataset, resampled with replacement to n_rows rows if specified.
+
+    Returns
+    -------
+    Pandas dataFrame, Pandas Series
+
+    """
+    data = Storage(project_dir).read("processed", columns = FEATURES + [TARGET])
+    if n_rows != None:
+        data = data.iloc[np.random.RandomState(seed).randint(0, len(data), n_rows)].reset_index(drop=True)
+    return data[FEATURES], data[TARGET]
+
+
+def run(X, y, workers, shared):
+    """
+    function which runs and measures the grid search of Train.
+
+    Returns
+    -------
+    dictionary
+
+    """
+    search = GridSearch(cv=4, scoring="accuracy", n_jobs=workers, shared=shared)
+    with PeakTreePss() as memory:
+        start = time.perf_counter()
+        best_params, best_score = search.search(DecisionTreeClassifier(random_state=99), PARAM_GRID, X, y)
+        seconds = time.perf_counter() - start
+    result = {"mode": "shared" if shared else "copy", "workers": workers, "rows": len(X),
+              "seconds": round(seconds, 3), "peak_pss_mb": memory.peak_mb(),
+              "best_params": best_params, "best_score": best_score}
+    print("{:<6} {:>3} workers  {:8.3f}s  {:8.1f} MB".format(result["mode"], workers, seconds, result["peak_pss_mb"] or float("nan")))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the parallel cross-validation of the hyperparameter search")
+    parser.add_argument("--project-dir", default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    parser.add_argument("--rows", type=int, help="rows resampled from the processed dataset, all its rows by default")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file, report/benchmarks/cv_workers_<commit>.json by default")
+    args = parser.parse_args()
+
+    X, y = training_data(args.project_dir, args.rows, args.seed)
+    commit = git_commit()
+    results = {"commit": commit,
+               "date": datetime.datetime.now().isoformat(timespec="seconds"),
+               "python": platform.python_version(),
+               "platform": platform.platform(),
+               "cpu_count": os.cpu_count(),
+               "rows": len(X),
+               "results": []}
+    for workers in args.workers:
+        for shared in [False, True]:
+            results["results"].append(run(X, y, workers, shared))
+    # both modes must find the same candidate
+    if len({json.dumps(result["best_params"], sort_keys=True) for result in results["results"]}) != 1:
+        print("The modes found different best parameters")
+
+    output = args.output
+    if output == None:
+        output = os.path.join(args.project_dir,"report","benchmarks","cv_workers_{}.json".format((commit or "unknown")[:10]))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+    print("Results written to", output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Nov 24 09:52:16 2022
+
+@author: fatima-zahrabanani
+
+Parity check of the cleaning engines of MakeDataset: synthetic original
+datasets (with anomalies and missing values) are cleaned with the pandas
+and the polars engines, which must give the same clean dataFrame (values,
+types, index), the same anomaly report and the same stored clean files.
+Exits with 1 if one of the checks fails.
+
+    python -m src.benchmarks.engine_parity --scales 1 10 --seeds 0 1 2
+"""
+from src.data.make_dataset import MakeDataset
+from src.data.exchange_rates import ExchangeRates, FixedRates
+from src.data.synthetic import generate_original, BASE_ROWS
+from src.data.storage import Storage
+from src.benchmarks.stages import link_references
+import pandas as pd
+import argparse
+import tempfile
+import filecmp
+import time
+import sys
+import os
+
+
+def clean(run_dir, engine, file_format):
+    """
+    function which cleans the original dataset of run_dir with an engine,
+    the clean dataset is stored in data/<engine>/.
+
+    Returns
+    -------
+    MakeDataset, seconds
+
+    """
+    os.makedirs(os.path.join(run_dir, engine, "data"), exist_ok=True)
+    storage = Storage(os.path.join(run_dir, engine), file_format)
+    rates = ExchangeRates(run_dir, source = FixedRates({"USD": 1.0}, default = 1.1))
+    start = time.perf_counter()
+    makeData = MakeDataset(run_dir, exchange_rates = rates, storage = storage, engine = engine)
+    makeData.clean_dataset()
+    return makeData, time.perf_counter() - start
+
+
+def check(run_dir, file_format = "csv"):
+    """
+    function which compares the two engines on the original dataset of run_dir.
+
+    Returns
+    -------
+    list of the failed checks, dictionary engine -> seconds
+
+    """
+    failures = []
+    pandasData, pandasSeconds = clean(run_dir, "pandas", file_format)
+    polarsData, polarsSeconds = clean(run_dir, "polars", file_format)
+    try:
+        pd.testing.assert_frame_equal(pandasData.get_df(), polarsData.get_df())
+    except AssertionError as error:
+        failures.append("clean dataFrames differ: {}".format(error))
+    pandasReport = {column: (report["rule"], report["rejected"]) for column, report in pandasData.anomaly_report.items()}
+    polarsReport = {column: (report["rule"], report["rejected"]) for column, report in polarsData.anomaly_report.items()}
+    if pandasReport != polarsReport:
+        failures.append("anomaly reports differ: {} != {}".format(pandasReport, polarsReport))
+    if file_format == "csv" and not filecmp.cmp(pandasData.storage.path("clean"), polarsData.storage.path("clean"), shallow=False):
+        failures.append("stored clean files differ")
+    if file_format != "csv":
+        try:
+            pd.testing.assert_frame_equal(pandasData.storage.read("clean"), polarsData.storage.read("clean"))
+        except AssertionError as error:
+            failures.append("stored clean datasets differ: {}".format(error))
+    return failures, {"pandas": pandasSeconds, "polars": polarsSeconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity check of the pandas and polars cleaning engines")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1])
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--formats", nargs="+", default=["csv", "parquet"], choices=["csv", "parquet", "feather"])
+    parser.add_argument("--project-dir", default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    args = parser.parse_args()
+
+    failed = False
+    for scale in args.scales:
+        for seed in args.seeds:
+            with tempfile.TemporaryDirectory() as run_dir:
+                link_references(args.project_dir, run_dir)
+                generate_original(run_dir, scale, seed)
+                for file_format in args.formats:
+                    failures, seconds = check(run_dir, file_format)
+                    failed = failed or len(failures) > 0
+                    print("{:>10} rows  seed {}  {:<8} pandas {:7.3f}s  polars {:7.3f}s  {}".format(
+                          int(scale*BASE_ROWS), seed, file_format, seconds["pandas"], seconds["polars"], "OK" if len(failures) == 0 else "FAILED"))
+                    for failure in failures:
+                        print("    " + failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
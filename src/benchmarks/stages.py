@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Nov 15 14:27:50 2022
+
+@author: fatima-zahrabanani
+
+Benchmark of every stage of the workflow (MakeDataset steps, BuildFeatures,
+Train and Predict) on synthetic datasets of several sizes. The wall time,
+peak resident memory and rows in/out of each step are written to a json
+file that can be compared with the one of another commit.
+
+    python -m src.benchmarks.stages --sizes 10000 100000 1000000 10000000
+    python -m src.benchmarks.stages --compare report/benchmarks/stages_<commit>.json
+"""
+from src.data.make_dataset import MakeDataset
+from src.data.exchange_rates import ExchangeRates, FixedRates
+from src.data.synthetic import generate_original, BASE_ROWS
+from src.instrumentation import PeakRss
+import pandas as pd
+import numpy as np
+import importlib.util
+import subprocess
+import tracemalloc
+import platform
+import argparse
+import resource
+import datetime
+import tempfile
+import sklearn
+import json
+import time
+import sys
+import os
+
+# parameters of the workflow, the ones of src.pipeline.Pipeline
+FEATURES = ["main_category","goal","currency","campaign_period"]
+TARGET = "state"
+COLUMNS_TO_KEEP = ["ID","state","main_category","currency","goal","campaign_period"]
+CATEGORICAL = ["main_category","currency"]
+
+
+class StageTimer:
+    """
+    class measuring the steps of a run: wall time, peak resident memory
+    during the step, and optionally the peak of the memory allocated
+    during the step (tracemalloc, slows down the steps).
+    """
+    def __init__(self, n_rows, trace_memory = False):
+        self.n_rows = n_rows
+        self.trace_memory = trace_memory
+        self.results = []
+
+    def measure(self, stage, function, rows = None):
+        """
+        function which runs and measures one step.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the step.
+        function : callable
+            Step, called without arguments.
+        rows : callable, optional
+            Returns the number of rows of the data of the step,
+            called before and after it.
+
+        Returns
+        -------
+        result of function
+
+        """
+        rows_in = rows() if rows != None else None
+        if self.trace_memory:
+            tracemalloc.start()
+        with PeakRss() as rss:
+            start = time.perf_counter()
+            result = function()
+            seconds = time.perf_counter() - start
+        peak = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]/2**20
+            tracemalloc.stop()
+        self.results.append({"rows": self.n_rows, "stage": stage, "seconds": round(seconds, 4),
+                             "peak_rss_mb": rss.peak_mb(),
+                             "traced_peak_mb": round(peak, 1) if peak != None else None,
+                             "max_rss_mb": round(max_rss_mb(), 1),
+                             "rows_in": rows_in, "rows_out": rows() if rows != None else None})
+        print("{:>10} rows  {:<40} {:8.3f}s".format(self.n_rows, stage, seconds))
+        return result
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss/2**20 if sys.platform == "darwin" else maxrss/2**10
+
+
+def link_references(project_dir, run_dir):
+    # the run directory uses the references of the project
+    os.makedirs(os.path.join(run_dir,"data"), exist_ok=True)
+    os.makedirs(os.path.join(run_dir,"models"), exist_ok=True)
+    if not os.path.exists(os.path.join(run_dir,"references")):
+        os.symlink(os.path.join(os.path.abspath(project_dir),"references"), os.path.join(run_dir,"references"))
+
+
+def run_size(project_dir, run_dir, n_rows, seed = 0, trace_memory = False, train = True):
+    """
+    function which runs and measures every stage of the workflow
+    on a synthetic dataset of n_rows rows.
+
+    Returns
+    -------
+    list of dictionaries, one per step
+
+    """
+    from src.features.build_features import BuildFeatures
+    from src.models.predict_model import Predict
+
+    link_references(project_dir, run_dir)
+    timer = StageTimer(n_rows, trace_memory)
+    timer.measure("generate", lambda: generate_original(run_dir, n_rows/BASE_ROWS, seed))
+
+    # cleaning, step by step as in MakeDataset.clean_dataset
+    rates = ExchangeRates(run_dir, source = FixedRates({"USD": 1.0}, default = 1.1))
+    makeData = timer.measure("clean.read_original", lambda: MakeDataset(run_dir, exchange_rates = rates))
+    rows = lambda: len(makeData.df)
+    timer.measure("clean.remove_unnecessary_columns", makeData.remove_unnecessary_columns, rows)
+    timer.measure("clean.remove_basic_anomaly", makeData.remove_basic_anomaly, rows)
+    timer.measure("clean.remove_unnecessary_rows", makeData.remove_unnecessary_rows, rows)
+    timer.measure("clean.remove_advanced_anomaly", makeData.remove_advanced_anomaly, rows)
+    timer.measure("clean.fill_nans", makeData.fill_nans, rows)
+    timer.measure("clean.write", lambda: makeData.storage.write(makeData.df, "clean"), rows)
+    clean = makeData.df
+    makeData.df = None
+
+    # feature engineering, as in Pipeline.run_features
+    buildFeatures = timer.measure("features.read", lambda: BuildFeatures(makeData.storage.read("clean"), run_dir, storage = makeData.storage))
+    rows = lambda: len(buildFeatures.df)
+    timer.measure("features.drop_outliers", lambda: buildFeatures.drop_outliers("backers"), rows)
+    timer.measure("features.drop_unused_columns", lambda: buildFeatures.drop_unused_columns(columns_to_keep = COLUMNS_TO_KEEP), rows)
+    timer.measure("features.target_encoding", lambda: buildFeatures.target_encoding(TARGET), rows)
+    timer.measure("features.feature_encoding", lambda: buildFeatures.feature_encoding(columns = CATEGORICAL), rows)
+    timer.measure("features.save_features", buildFeatures.save_features, rows)
+    buildFeatures = None
+
+    if train:
+        from src.models.train_model import Train
+        trainer = timer.measure("train.read", lambda: Train(run_dir, FEATURES, TARGET, ["failed","successful"], 0.25, storage = makeData.storage))
+        rows = lambda: len(trainer.data)
+        timer.measure("train.split_data", lambda: trainer.split_data(trainer.test_size), rows)
+        timer.measure("train.hyperparameter_tuning", trainer.hyperparameter_tuning_training, lambda: len(trainer.train))
+        timer.measure("train.accuracy", trainer.accuracy, lambda: len(trainer.test))
+        # only checks that shap is installed, an ImportError of compute_shap_values is not hidden
+        if importlib.util.find_spec("shap") != None:
+            timer.measure("train.shap_values", trainer.compute_shap_values, lambda: len(trainer.train))
+        else:
+            print("shap is not installed, train.shap_values is skipped")
+        # the model is saved like in Train.start_training
+        timer.measure("train.export_tree", trainer.export_tree, lambda: len(trainer.test))
+        trainer = None
+
+        # loading of the bundle and prediction of the clean projects
+        predict = Predict(run_dir, None, FEATURES, TARGET)
+        timer.measure("predict.load_model", predict.load_model)
+        timer.measure("predict.predict", lambda: predict.predict(clean), lambda: len(clean))
+
+        # out-of-core training on the same processed dataset, its memory is bounded by the chunks
+        trainer = Train(run_dir, FEATURES, TARGET, ["failed","successful"], 0.25, storage = makeData.storage, out_of_core = True)
+        timer.measure("train.out_of_core", trainer.start_out_of_core_training)
+        timer.results[-1]["accuracy"] = trainer.metrics["test_accuracy"]
+        timer.results[-1]["accuracy"] = timer.measure("train.baseline", trainer.baseline_accuracy)
+    return timer.results
+
+
+def git_commit():
+    # commit of the benchmarked code
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous):
+    """
+    function which prints the ratio of the wall time of each step
+    to the one of a previous results file.
+
+    Returns
+    -------
+    None.
+
+    """
+    before = {(result["rows"], result["stage"]): result for result in previous["results"]}
+    print("\nComparison with commit", previous.get("commit"))
+    for result in results["results"]:
+        old = before.get((result["rows"], result["stage"]))
+        if old == None or old["seconds"] == 0:
+            continue
+        print("{:>10} rows  {:<40} {:8.3f}s -> {:8.3f}s  x{:.2f}".format(result["rows"], result["stage"], old["seconds"], result["seconds"], result["seconds"]/old["seconds"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of every stage of the workflow on synthetic datasets")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--project-dir", default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    parser.add_argument("--output", help="results file, report/benchmarks/stages_<commit>.json by default")
+    parser.add_argument("--compare", help="results file of another commit")
+    parser.add_argument("--no-train", action="store_true", help="skip the training and prediction stages")
+    parser.add_argument("--tracemalloc", action="store_true", help="also trace the memory allocations (slower)")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {"commit": commit,
+               "date": datetime.datetime.now().isoformat(timespec="seconds"),
+               "python": platform.python_version(),
+               "platform": platform.platform(),
+               "cpu_count": os.cpu_count(),
+               "versions": {"pandas": pd.__version__, "numpy": np.__version__, "sklearn": sklearn.__version__},
+               "seed": args.seed,
+               "results": []}
+    for n_rows in args.sizes:
+        # every size runs in a new directory, nothing is reused between them
+        with tempfile.TemporaryDirectory() as run_dir:
+            results["results"] += run_size(args.project_dir, run_dir, n_rows, args.seed, args.tracemalloc, not args.no_train)
+
+    output = args.output
+    if output == None:
+        output = os.path.join(args.project_dir,"report","benchmarks","stages_{}.json".format((commit or "unknown")[:10]))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+    print("Results written to", output)
+
+    if args.compare != None:
+        with open(args.compare, 'r') as previous_file:
+            compare(results, json.load(previous_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Nov 25 10:12:07 2022
+
+@author: fatima-zahrabanani
+
+Parity check of the compiled trees: sklearn trees trained on generated
+projects (with and without missing values) are exported to a CompiledTree,
+saved and loaded (npz file and model bundle), and must predict the same
+classes as sklearn on new projects, including rows with missing values
+and categories that were not seen when training.
+Exits with 1 if one of the checks fails.
+
+    python -m src.benchmarks.tree_parity --rows 20000 --seeds 0 1 2
+"""
+from src.models.tree_inference import export_tree, CompiledTree
+from src.models.model_bundle import write_bundle, ModelBundle
+from src.features.build_features import Encoders
+from src.benchmarks.stages import FEATURES, TARGET
+from sklearn.tree import DecisionTreeClassifier
+import pandas as pd
+import numpy as np
+import argparse
+import tempfile
+import sys
+import os
+
+# hyperparameters of the checked trees
+PARAMS = [{"max_depth": 3, "min_samples_leaf": 5, "criterion": "gini"},
+          {"max_depth": 6, "min_samples_leaf": 1, "criterion": "entropy"},
+          {"max_depth": None, "min_samples_leaf": 1, "criterion": "gini"}]
+
+MAIN_CATEGORIES = ["Art", "Comics", "Crafts", "Dance", "Design", "Fashion", "Film & Video", "Food",
+                   "Games", "Journalism", "Music", "Photography", "Publishing", "Technology", "Theater"]
+CURRENCIES = ["AUD", "CAD", "CHF", "DKK", "EUR", "GBP", "NOK", "NZD", "SEK", "USD"]
+
+
+def generate_projects(n_rows, seed, missing = 0.0, unseen = 0.0):
+    """
+    function which generates projects with the features of the model and
+    a target depending on them.
+
+    Parameters
+    ----------
+    n_rows : int
+        Number of projects.
+    seed : int
+        Seed of the generator.
+    missing : float, optional
+        Proportion of missing values in each feature. The default is 0.
+    unseen : float, optional
+        Proportion of categories that are not in the vocabularies. The default is 0.
+
+    Returns
+    -------
+    Pandas dataFrame
+
+    """
+    random = np.random.RandomState(seed)
+    df = pd.DataFrame({"main_category": random.choice(MAIN_CATEGORIES, n_rows),
+                       "goal": np.round(random.lognormal(8.5, 1.5, n_rows), 2),
+                       "currency": random.choice(CURRENCIES, n_rows, p=[0.05]*9 + [0.55]),
+                       "campaign_period": random.randint(1, 61, n_rows).astype(float)})
+    score = -np.log(df["goal"])/3 + (df["campaign_period"] < 30) + df["main_category"].isin(["Comics", "Games", "Design"])
+    df[TARGET] = np.where(score + random.normal(0, 0.5, n_rows) > -2, "successful", "failed")
+    for column in FEATURES:
+        df.loc[random.rand(n_rows) < missing, column] = np.nan
+    for column in ["main_category", "currency"]:
+        df.loc[random.rand(n_rows) < unseen, column] = "Unseen"
+    return df
+
+
+def check(n_rows, seed, missing):
+    """
+    function which trains the trees of PARAMS on generated projects with
+    a proportion of missing values and compares their predictions with
+    the ones of the compiled trees on new projects.
+
+    Returns
+    -------
+    list of the failed checks
+
+    """
+    failures = []
+    train = generate_projects(n_rows, seed, missing = missing)
+    encoders = Encoders()
+    for column in ["main_category", "currency"]:
+        encoders.fit_column(column, train[column])
+    encoders.fit_target(TARGET, train[TARGET])
+    encoded = encoders.transform(train)
+
+    # new projects: missing values in every feature and unseen categories
+    new = generate_projects(n_rows//2, seed + 1000, missing = 0.2, unseen = 0.1)
+    X = encoders.transform(new[FEATURES]).to_numpy(dtype=np.float64)
+
+    for params in PARAMS:
+        name = "{} missing {:.0%} {}".format(seed, missing, params)
+        model = DecisionTreeClassifier(random_state=seed, **params).fit(encoded[FEATURES].to_numpy(), encoded[TARGET])
+        expected = model.predict(X)
+        compiled = export_tree(model, FEATURES)
+        with tempfile.TemporaryDirectory() as tmpDir:
+            npzPath = os.path.join(tmpDir, "tree.npz")
+            compiled.save(npzPath)
+            bundlePath = os.path.join(tmpDir, "model.bundle")
+            write_bundle(bundlePath, compiled, encoders)
+            bundle = ModelBundle.load(bundlePath, verify = True)
+            predictions = {"compiled tree": compiled.predict(X),
+                           "npz tree": CompiledTree.load(npzPath).predict(X),
+                           "bundle tree": bundle.tree.predict(X)}
+            # the bundle also encodes the raw projects and decodes the classes
+            bundle_names = bundle.predict(new)
+            del bundle
+        for source, predicted in predictions.items():
+            different = int((predicted != expected).sum())
+            if different > 0:
+                failures.append("{}: the {} differs from sklearn on {} rows out of {}".format(name, source, different, len(X)))
+        different = int((bundle_names != encoders.inverse_target(expected)).sum())
+        if different > 0:
+            failures.append("{}: the bundle predicts other target names on {} rows out of {}".format(name, different, len(X)))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity check of the compiled trees and the sklearn trees")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--missing", type=float, nargs="+", default=[0.0, 0.1],
+                        help="proportions of missing values in the training data")
+    args = parser.parse_args()
+
+    failed = False
+    for seed in args.seeds:
+        for missing in args.missing:
+            failures = check(args.rows, seed, missing)
+            failed = failed or len(failures) > 0
+            print("seed {}  missing {:>4.0%}  {}".format(seed, missing, "OK" if len(failures) == 0 else "FAILED"))
+            for failure in failures:
+                print("    " + failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 26 09:41:17 2022
+
+@author: fatima-zahrabanani
+"""
+import pandas as pd
+import numpy as np
+import os
+
+# rate stores already loaded by the current process
+# keys -> values:
+    # csv path -> (file signature, dataFrame of rates)
+_rates_memory = dict()
+
+
+class FixedRates:
+    """
+    local source of exchange rates returning fixed rates, used instead of
+    forex_python when there is no network (e.g. tests, air-gapped workers)
+    """
+    def __init__(self, rates = None, default = 1.0):
+        # dictionary currency -> value of one unit in USD
+        self.rates = rates if rates != None else dict()
+        self.default = default
+
+    def get_rate(self, base_cur, dest_cur, date_obj = None):
+        return self.rates.get(base_cur, self.default)
+
+
+class ExchangeRates:
+    """
+    class managing the local store of exchange rates to USD.
+    The store is a csvFile with the columns currency, date and rate
+    (value of one unit of the currency in USD at that date).
+    """
+    def __init__(self, project_dir, filename = "exchange_rates.csv", source = "forex"):
+        self.project_dir = project_dir
+        self.csvPath = os.path.join(self.project_dir,"data",filename)
+
+        # source used to import the rates missing from the store:
+            # "forex" -> forex_python CurrencyRates (needs network)
+            # None -> offline, the closest stored date is used instead
+            # any object with a get_rate(base_cur, dest_cur, date_obj) method
+        if source == "forex":
+            from forex_python.converter import CurrencyRates
+            source = CurrencyRates()
+        self.source = source
+
+    def load(self):
+        """
+        function which returns the stored rates. The csvFile is only read
+        again if it has changed since the last call in this process.
+
+        Returns
+        -------
+        Pandas dataFrame
+            Rates with the columns currency, date and rate.
+
+        """
+        if not os.path.exists(self.csvPath):
+            return pd.DataFrame({"currency": pd.Series(dtype=object),
+                                 "date": pd.Series(dtype="datetime64[ns]"),
+                                 "rate": pd.Series(dtype=float)})
+
+        stat = os.stat(self.csvPath)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if self.csvPath in _rates_memory and _rates_memory[self.csvPath][0] == signature:
+            return _rates_memory[self.csvPath][1]
+
+        rates = pd.read_csv(self.csvPath, parse_dates=["date"])
+        _rates_memory[self.csvPath] = (signature, rates)
+        return rates
+
+    def add_rates(self, rates):
+        """
+        function which adds rates to the store. Rates already stored
+        for the same currency and date are replaced.
+
+        Parameters
+        ----------
+        rates : Pandas dataFrame
+            Rates with the columns currency, date and rate.
+
+        Returns
+        -------
+        None.
+
+        """
+        rates = rates[["currency","date","rate"]].copy()
+        rates["date"] = pd.to_datetime(rates["date"]).dt.normalize()
+        stored = pd.concat([self.load(), rates], ignore_index=True)
+        stored = stored.drop_duplicates(["currency","date"], keep="last").sort_values(["currency","date"])
+
+        os.makedirs(os.path.dirname(self.csvPath), exist_ok=True)
+        stored.to_csv(self.csvPath, index=False, date_format="%Y-%m-%d")
+        stat = os.stat(self.csvPath)
+        _rates_memory[self.csvPath] = ((stat.st_mtime_ns, stat.st_size), stored.reset_index(drop=True))
+
+    def import_csv(self, csvFile):
+        """
+        function which imports rates from a csvFile with
+        the columns currency, date and rate.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.add_rates(pd.read_csv(csvFile))
+
+    def import_rates(self, pairs, source = None):
+        """
+        function which fetches the rates of (currency, date) pairs
+        from a source, one call per pair, and adds them to the store.
+
+        Parameters
+        ----------
+        pairs : Pandas dataFrame
+            Pairs with the columns currency and date.
+        source : object, optional
+            Object with a get_rate(base_cur, dest_cur, date_obj) method.
+            The default is self.source.
+
+        Returns
+        -------
+        None.
+
+        """
+        source = self.source if source == None else source
+        pairs = pairs[["currency","date"]].dropna().drop_duplicates()
+        if len(pairs) == 0:
+            return
+        rates = [source.get_rate(currency, 'USD', date.to_pydatetime())
+                 for currency, date in zip(pairs["currency"], pairs["date"])]
+        self.add_rates(pairs.assign(rate = rates))
+
+    def get_rates(self, pairs):
+        """
+        function which returns the rate of each (currency, date) pair.
+        Missing pairs are imported from the source if there is one,
+        otherwise the rate of the closest stored date is used.
+
+        Parameters
+        ----------
+        pairs : Pandas dataFrame
+            Unique pairs with the columns currency and date.
+
+        Returns
+        -------
+        Pandas Series
+            Rates indexed by (currency, date).
+
+        """
+        index = pd.MultiIndex.from_frame(pairs[["currency","date"]])
+        stored = self.load()
+        rates = stored.set_index(["currency","date"])["rate"].reindex(index)
+
+        missing = rates.isna() & (index.get_level_values("currency") != "USD")
+        if missing.any() and self.source != None:
+            self.import_rates(pairs[missing.to_numpy()])
+            stored = self.load()
+            rates = stored.set_index(["currency","date"])["rate"].reindex(index)
+            missing = rates.isna() & (index.get_level_values("currency") != "USD")
+
+        if missing.any() and len(stored) > 0:
+            # closest stored date of the same currency
+            query = pairs[missing.to_numpy()].dropna().sort_values("date")
+            closest = pd.merge_asof(query, stored.sort_values("date"), on="date", by="currency", direction="nearest")
+            rates.update(closest.set_index(["currency","date"])["rate"])
+
+        rates[index.get_level_values("currency") == "USD"] = 1.0
+        return rates
+
+    def convert_to_usd(self, currency, date, amount):
+        """
+        function which converts amounts to USD with one join
+        on (currency, date) and one multiplication.
+
+        Parameters
+        ----------
+        currency : Pandas Series
+            Currency code of each amount.
+        date : Pandas Series
+            Date of the conversion of each amount.
+        amount : Pandas Series
+            Amounts to convert.
+
+        Returns
+        -------
+        Pandas Series
+            Amounts in USD, nan if the rate is unknown.
+
+        """
+        query = pd.DataFrame({"currency": currency.astype(object), "date": pd.to_datetime(date).dt.normalize()})
+        pairs = query.dropna().drop_duplicates()
+        rates = self.get_rates(pairs)
+        query_rates = rates.reindex(pd.MultiIndex.from_frame(query)).to_numpy(dtype=float)
+
+        unknown = query["currency"][np.isnan(query_rates) & query["currency"].notna().to_numpy()].unique()
+        if len(unknown) > 0:
+            print("No exchange rate stored for:", list(unknown))
+        return amount * query_rates
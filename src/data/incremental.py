@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 31 15:32:46 2022
+
+@author: fatima-zahrabanani
+"""
+import pandas as pd
+import hashlib
+import json
+import os
+
+# name of the dataset storing the fingerprints of the cleaned rows
+INDEX_NAME = "clean_index"
+
+
+def row_fingerprints(df):
+    """
+    function which fingerprints the rows of the original dataset by their
+    ID and a hash of their values. The values are hashed as text, a row
+    parsed with other types is only seen as modified and cleaned again.
+
+    Parameters
+    ----------
+    df : Pandas dataFrame
+        Rows of the original dataset.
+
+    Returns
+    -------
+    Pandas dataFrame
+        Columns label (index of the row), ID and row_hash.
+
+    """
+    hashes = pd.util.hash_pandas_object(df.astype(str), index=False)
+    return pd.DataFrame({"label": df.index.to_numpy(),
+                         "ID": df["ID"].to_numpy(),
+                         "row_hash": hashes.to_numpy().view("int64")})
+
+
+def settings_hash(settings):
+    """
+    function which hashes the settings of the cleaning, the stored clean
+    dataset can only be updated if they didn't change.
+    """
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def read_fingerprints(storage, settings):
+    """
+    function which reads the fingerprints of the rows already cleaned.
+
+    Parameters
+    ----------
+    storage : Storage
+        Storage of the clean dataset.
+    settings : dictionary
+        Settings of the current cleaning.
+
+    Returns
+    -------
+    Pandas dataFrame
+        Fingerprints, None if there are none or if they were
+        computed with other settings.
+
+    """
+    settingsPath = os.path.join(storage.project_dir,"data",INDEX_NAME+".json")
+    if not (storage.exists(INDEX_NAME) and storage.exists("clean") and os.path.exists(settingsPath)):
+        return None
+    with open(settingsPath, 'r') as settings_file:
+        if json.load(settings_file).get("settings") != settings_hash(settings):
+            return None
+    return storage.read(INDEX_NAME)
+
+
+def write_fingerprints(storage, fingerprints, settings):
+    """
+    function which stores the fingerprints of the cleaned rows
+    and the settings of the cleaning.
+
+    Returns
+    -------
+    None.
+
+    """
+    storage.write(fingerprints, INDEX_NAME, index=False)
+    settingsPath = os.path.join(storage.project_dir,"data",INDEX_NAME+".json")
+    with open(settingsPath, 'w') as settings_file:
+        json.dump({"settings": settings_hash(settings), "rows": len(fingerprints)}, settings_file)
+
+
+def compare_fingerprints(previous, current):
+    """
+    function which compares the fingerprints of the previous run
+    with the fingerprints of the current original dataset.
+
+    Parameters
+    ----------
+    previous : Pandas dataFrame
+        Fingerprints of the rows already cleaned.
+    current : Pandas dataFrame
+        Fingerprints of the rows of the original dataset.
+
+    Returns
+    -------
+    numpy array
+        IDs having new, modified or deleted rows. All the rows of
+        these IDs have to be cleaned again.
+    Pandas Series
+        Current label of the unchanged rows indexed by their previous label.
+
+    """
+    # identical rows with the same ID are matched in order
+    previous = previous.assign(occurrence = previous.groupby(["ID","row_hash"]).cumcount())
+    current = current.assign(occurrence = current.groupby(["ID","row_hash"]).cumcount())
+    merged = previous.merge(current, on=["ID","row_hash","occurrence"], how="outer",
+                            suffixes=("_previous","_current"), indicator=True)
+
+    changed_ids = merged.loc[merged["_merge"] != "both", "ID"].unique()
+    unchanged = merged[merged["_merge"] == "both"]
+    labels = pd.Series(unchanged["label_current"].to_numpy(dtype="int64"),
+                       index=unchanged["label_previous"].to_numpy(dtype="int64"))
+    return changed_ids, labels
@@ -7,10 +7,52 @@ Created on Mon Oct 17 16:09:46 2022
 """
 import pandas as pd
 import numpy as np
-from bs4 import BeautifulSoup
-import pycountry
+from src.data.references import load_options
+from src.data.exchange_rates import ExchangeRates
+from src.data.storage import Storage
+from src.instrumentation import step, count_rule, instrument, active_recorder, emit_records
+from src.data.incremental import row_fingerprints, read_fingerprints, write_fingerprints, compare_fingerprints
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import copy
 import os
-import re
+import time
+
+# types of the columns of the original dataset used by the typed loader
+# keys -> values:
+    # column -> "integer", "numerical", "dateTime", "category" or "text"
+ORIGINAL_SCHEMA = {"ID": "integer", "name": "text", "category": "category", "main_category": "category",
+                   "currency": "category", "deadline": "dateTime", "goal": "numerical", "launched": "dateTime",
+                   "pledged": "numerical", "state": "category", "backers": "numerical", "country": "category",
+                   "usd_pledged": "numerical"}
+
+# engines running the cleaning steps
+ENGINES = ["pandas", "polars"]
+
+
+def downcast_numeric(values):
+    """
+    function which stores numerical values in the smallest type,
+    floats are only turned into float32 if no value changes.
+
+    Parameters
+    ----------
+    values : Pandas Series
+        Numerical values.
+
+    Returns
+    -------
+    Pandas Series
+
+    """
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return pd.to_numeric(values, downcast="integer")
+    if pd.api.types.is_float_dtype(values.dtype) and values.dtype != "float32":
+        downcast = values.astype("float32")
+        if ((downcast.astype(values.dtype) == values) | values.isna()).all():
+            return downcast
+    return values
+
 
 class MakeDataset:
     """
@@ -20,16 +62,34 @@ class MakeDataset:
     otherwise filling the missing values and by checking that the 
     relationships between columns in the same row are respected.
     """
-    def __init__(self,project_dir,missing_values_percent = 85, html_parent_child=None, allowed_values = None):
+    def __init__(self,project_dir,missing_values_percent = 85, html_parent_child=None, allowed_values = None, chunksize = None, exchange_rates = None, storage = None, workers = 1, typed = False, engine = "pandas"):
         # directory of the project
         self.project_dir = project_dir
         
-        # create original dataframe from csvFile
-        csvPath = os.path.join(self.project_dir,"data","original.csv")
-        self.df = pd.read_csv(csvPath)
+        # engine of the steps 1-4 of clean_dataset: "pandas" or "polars" (one lazy
+        # query, multithreaded, see src.data.polars_engine)
+        # the polars engine reads the whole original dataset with its own types
+        if engine not in ENGINES:
+            raise ValueError("Unknown engine {}, expected one of {}".format(engine, ENGINES))
+        if engine == "polars" and (chunksize != None or workers > 1 or typed):
+            raise ValueError("The polars engine is multithreaded and reads the whole dataset, chunksize, workers and typed are not supported")
+        self.engine = engine
+        
+        # number of rows read at once in streaming mode
+        # if not specified the whole original dataset is loaded in memory
+        self.chunksize = chunksize
         
-        # rename columns by deleting extra space
-        self.df.rename(columns={col : col.strip().replace(" ","_") for col in list(self.df.columns)},inplace = True)
+        # load the original dataset with the types of ORIGINAL_SCHEMA
+        # (categories, downcast numbers, dates) and only its columns
+        self.typed = typed
+        
+        # create original dataframe from csvFile
+        # in streaming mode the chunks are only read by clean_dataset
+        # and the polars engine scans the csvFile itself
+        if self.chunksize == None and self.engine == "pandas":
+            self.df = self.read_original()
+        else:
+            self.df = None
         
         # maximum limit of percentage of missing values in a column
         self.missing_values_percent = missing_values_percent
@@ -51,19 +111,119 @@ class MakeDataset:
             # "dateTime" -> columns' indices which values should be dateTime
             # "values" -> list of tuples [(column indice, list of allowed values),..]
         self.set_allowed_values(allowed_values)
+        
+        # store of exchange rates used to fill usd_pledged
+        # if not specified the rates are read from data/exchange_rates.csv
+        # and the missing ones are imported with forex_python
+        self.exchange_rates = exchange_rates
+        
+        # storage of the clean dataset
+        # if not specified the dataset is stored in data/clean.csv
+        self.storage = storage if storage != None else Storage(self.project_dir)
+        
+        # dictionary reporting the values replaced by nan in remove_basic_anomaly
+        # keys -> values:
+            # column -> {"rule": rule name, "rejected": number of values, "seconds": time spent}
+        self.anomaly_report = dict()
+        
+        # number of processes running the row-local cleaning steps
+        # the pool of processes only exists during clean_dataset
+        self.workers = workers
+        self.executor = None
             
         
         
         
     
     def get_df(self):
+        # with the polars engine the original dataset is only loaded if asked before the cleaning
+        if self.df is None and self.engine == "polars":
+            self.df = self.read_original()
         return self.df
     
+    @step("clean.read_original")
+    def read_original(self, **kwargs):
+        """
+        function which reads the original dataset and renames its columns
+        by deleting extra space.
+
+        Parameters
+        ----------
+        **kwargs : 
+            Extra arguments passed to pd.read_csv (e.g. chunksize).
+
+        Returns
+        -------
+        Pandas dataFrame or iterator of Pandas dataFrames if chunksize is given
+
+        """
+        csvPath = os.path.join(self.project_dir,"data","original.csv")
+        
+        def rename(df):
+            # rename columns by deleting extra space
+            df.rename(columns={col : col.strip().replace(" ","_") for col in list(df.columns)},inplace = True)
+            if self.typed:
+                self.set_types(df)
+            return df
+        
+        if self.typed:
+            # the columns are selected and the categories are created at read time
+            header = pd.read_csv(csvPath, nrows=0).columns
+            schema = {col: ORIGINAL_SCHEMA.get(col.strip().replace(" ","_")) for col in header}
+            kwargs["usecols"] = [col for col in header if schema[col] != None]
+            kwargs["dtype"] = {col: "category" for col in header if schema[col] == "category"}
+        
+        if kwargs.get("chunksize") == None:
+            return rename(pd.read_csv(csvPath, **kwargs))
+        return (rename(chunk) for chunk in pd.read_csv(csvPath, **kwargs))
+    
+    def set_types(self, df):
+        """
+        function which gives the columns of ORIGINAL_SCHEMA their type 
+        when none of their values is lost. The columns with non consistent
+        values keep their type until remove_basic_anomaly.
+
+        Parameters
+        ----------
+        df : Pandas dataFrame
+            Original dataset (or chunk) with renamed columns.
+
+        Returns
+        -------
+        None.
+
+        """
+        for column in df.columns:
+            kind = ORIGINAL_SCHEMA.get(column)
+            if kind in ("integer", "numerical"):
+                values = pd.to_numeric(df[column], errors='coerce')
+            elif kind == "dateTime":
+                values = pd.to_datetime(df[column], errors='coerce')
+            else:
+                continue
+            if values.isna().sum() == df[column].isna().sum():
+                df[column] = downcast_numeric(values) if kind != "dateTime" else values
+    
+    def original_chunks(self):
+        """
+        function which iterates over the original dataset, by chunks 
+        in streaming mode otherwise as one loaded dataFrame.
+
+        Returns
+        -------
+        iterator of Pandas dataFrames
+
+        """
+        if self.chunksize == None:
+            return iter([self.df])
+        return self.read_original(chunksize = self.chunksize)
+    
     def select_allowed_options(self,column):
         """
         function using the html element from the website source code
         which can be found in the references folder, in order to get 
-        all the options of a column value.
+        all the options of a column value. The parsed options are cached
+        (see src.data.references.load_options).
         
         Parameters
         ----------
@@ -75,39 +235,9 @@ class MakeDataset:
         list of options of the column
 
         """
-        # path of the html file with the options of the column
-        htmlFile = os.path.join(self.project_dir,"references",column+".txt")
-        text_file = open(htmlFile, 'r')
-        html = text_file.read()
-        
-        # parse html
-        soup = BeautifulSoup(html,'html.parser')
+        # the html file is only parsed if its options are not already cached
         parent,child = self.html_parent_child[column]
-        subject_options = [i.findAll(child) for i in soup.findAll(parent)]
-        subject_options = [[re.sub("<.*?>", "", str(option).replace("&amp;","&")) for option in subject_option] for subject_option in subject_options]
-        #close file
-        text_file.close()
-    
-        if column == "country":
-            # the options in countries are the names but in the csvFile 
-            # they are specified as the 2_alpha code
-            # so we turn the names into their coresponding alpha_2 code
-            countries = {}
-            for country in pycountry.countries:
-                countries[country.name] = country.alpha_2
-            subject_options = [countries.get(country.replace("the ", ""), 'Unknown code') for country in subject_options[0]]
-    
-        if column == "currency":
-            # only keep the currency 3 characters code which is between parentheses
-            subject_options = [value.strip().split('(')[-1][:-1] for value in subject_options[0]]
-        
-        if column == "main_category":
-            subject_options = subject_options[0][1:]
-        
-        if len(subject_options)==1:
-            return subject_options[0]
-    
-        return subject_options
+        return load_options(self.project_dir, column, parent, child)
 
     
     def set_allowed_values(self,allowed_values = None):
@@ -143,6 +273,7 @@ class MakeDataset:
                 (11,self.select_allowed_options("country")))
             
     
+    @step("clean.remove_basic_anomaly", rows="df")
     def remove_basic_anomaly(self):
         """
         function which detects basic anomaly in data and replace 
@@ -155,26 +286,75 @@ class MakeDataset:
 
         """
         # non numerical values will be replaced by nan
-        cols = self.df.columns[self.allowed_values["numerical"]]
-        self.df[cols] = self.df[cols].apply(pd.to_numeric, errors='coerce')
+        for column in self.df.columns[self.allowed_values["numerical"]]:
+            if self.typed:
+                self.validate_column(column, "numerical", lambda values: downcast_numeric(pd.to_numeric(values, errors='coerce')))
+            else:
+                self.validate_column(column, "numerical", lambda values: pd.to_numeric(values, errors='coerce'))
         
         # values not representing time will be replaced by nan
-        cols = self.df.columns[self.allowed_values["dateTime"]]
-        self.df[cols] = self.df[cols].apply(pd.to_datetime, errors='coerce')
-        
-        # function that return value if it belongs to the allowed list otherwise return nan
-        def is_in_list(value, allowed_values):
-            if value in allowed_values:
-                return value
-            else:
-                return np.nan
+        for column in self.df.columns[self.allowed_values["dateTime"]]:
+            self.validate_column(column, "dateTime", lambda values: pd.to_datetime(values, errors='coerce'))
             
         # values not belonging to the allowed lists will be replaced by nan
+        # the membership is tested on the whole column at once with a hash set
         for column_index, allowed_values in self.allowed_values["values"]:
-            self.df[self.df.columns[column_index]] = self.df[self.df.columns[column_index]].apply(
-                is_in_list, allowed_values=allowed_values)
+            allowed_set = set(allowed_values)
+            self.validate_column(self.df.columns[column_index], "values", 
+                                 lambda values: values.where(values.isin(allowed_set)))
+    
+    def validate_column(self, column, rule, validate):
+        """
+        function which replaces the column by its validated version 
+        and reports the number of non missing values rejected by the rule 
+        in self.anomaly_report.
+
+        Parameters
+        ----------
+        column : str
+            column name
+        rule : str
+            name of the rule ("numerical", "dateTime" or "values")
+        validate : function
+            function taking the column and returning it with 
+            non valid values replaced by nan
+
+        Returns
+        -------
+        None.
+
+        """
+        start = time.perf_counter()
+        values = self.df[column]
+        validated = validate(values)
+        rejected = int((values.notna() & validated.isna()).sum())
+        self.df[column] = validated
+        
+        # accumulate the report (several chunks can be validated)
+        report = self.anomaly_report.setdefault(column, {"rule": rule, "rejected": 0, "seconds": 0.0})
+        report["rejected"] += rejected
+        report["seconds"] += time.perf_counter() - start
+        count_rule("{} ({})".format(column, rule), rejected)
+    
+    def print_anomaly_report(self):
+        """
+        function which prints the number of values replaced by nan 
+        and the time spent for each rule of remove_basic_anomaly.
+
+        Returns
+        -------
+        None.
+
+        """
+        for column, report in self.anomaly_report.items():
+            if report["seconds"] == None:
+                # the rules run together in the polars query
+                print("{} ({}): {} values rejected".format(column, report["rule"], report["rejected"]))
+            else:
+                print("{} ({}): {} values rejected in {:.3f}s".format(column, report["rule"], report["rejected"], report["seconds"]))
             
     
+    @step("clean.fill_nans", rows="df")
     def fill_nans(self):
         """
         function which fills missing values that can be restored 
@@ -185,34 +365,84 @@ class MakeDataset:
         None.
 
         """
-        from forex_python.converter import CurrencyRates
-        # fill usd_pledged column based on currency and pledged columns
-        c = CurrencyRates()
-        self.df['usd_pledged'] = self.df.apply(lambda row: c.convert(row["currency"],'USD',row["pledged"], row["deadline"]) if np.isnan(row['usd_pledged']) else row['usd_pledged'], axis=1)
+        # fill usd_pledged column based on currency, deadline and pledged columns
+        # the rates come from the local store (see src.data.exchange_rates)
+        missing = self.df['usd_pledged'].isna()
+        count_rule("usd_pledged converted", missing.sum())
+        if missing.any():
+            if self.exchange_rates == None:
+                self.exchange_rates = ExchangeRates(self.project_dir)
+            self.df.loc[missing,'usd_pledged'] = self.exchange_rates.convert_to_usd(
+                self.df.loc[missing,'currency'], self.df.loc[missing,'deadline'], self.df.loc[missing,'pledged'])
             
         # fill state based on goal and pledged columns
-        self.df['state'] = self.df.apply(lambda row: "successful" if (row['goal'] <= row['pledged']) else "failed", axis=1)
+        self.df['state'] = np.where(self.df['goal'] <= self.df['pledged'], "successful", "failed")
+    
+    def unnecessary_columns(self, missing_counts, n_rows):
+        """
+        function which selects the columns with higher percentage 
+        of missing values than the attribute missing_values_percent.
+
+        Parameters
+        ----------
+        missing_counts : Pandas Series
+            Number of missing values for each column.
+        n_rows : int
+            Total number of rows.
+
+        Returns
+        -------
+        list of columns' names
+
+        """
+        # check the percentage of missing values for each column
+        missing_percent = (missing_counts*100)/n_rows
+        return list(missing_percent[missing_percent > self.missing_values_percent].index)
+    
+    def count_missing_values(self):
+        """
+        function which counts the missing values of each column 
+        with one pass over the original dataset read by chunks.
+
+        Returns
+        -------
+        Pandas Series
+            Number of missing values for each column.
+        int
+            Total number of rows.
+
+        """
+        missing_counts = None
+        n_rows = 0
+        for chunk in self.original_chunks():
+            counts = chunk.isna().sum()
+            missing_counts = counts if missing_counts is None else missing_counts + counts
+            n_rows += len(chunk)
+        return missing_counts, n_rows
     
-    def remove_unnecessary_columns(self):
+    @step("clean.remove_unnecessary_columns", rows="df")
+    def remove_unnecessary_columns(self, columns = None):
         """
         function which drops columns with higher percentage 
         than the attribute missing_values_percent.
 
+        Parameters
+        ----------
+        columns : list, optional
+            Columns to drop. If not specified they are computed from self.df.
+
         Returns
         -------
         None.
 
         """
-        cols = []
-        
-        # check the percentage of missing values for each column
-        for i in range(0,len(self.df.columns)):
-            missing_percent = (self.df.iloc[:,i].isna().sum()*100)/len(self.df)
-            if missing_percent > self.missing_values_percent:
-                cols.append(i)
+        if columns == None:
+            columns = self.unnecessary_columns(self.df.isna().sum(), len(self.df))
                 
-        self.df.drop(self.df.columns[cols], axis=1, inplace = True)
+        self.df.drop(columns, axis=1, inplace = True)
+        count_rule("columns dropped", len(columns))
         
+    @step("clean.remove_unnecessary_rows", rows="df")
     def remove_unnecessary_rows(self):
         """
         function which drops unnecessary rows based on previous analysis.
@@ -223,11 +453,16 @@ class MakeDataset:
 
         """
         # delete rows with state "canceled","live","suspended" 
+        n_rows = len(self.df)
         self.df = self.df[self.df["state"].isin(["failed","successful","undefined",np.nan])]
+        count_rule("state canceled, live or suspended", n_rows - len(self.df))
         # delete rows with no category
+        n_rows = len(self.df)
         self.df = self.df[self.df["category"].notna()]
+        count_rule("missing category", n_rows - len(self.df))
         
     
+    @step("clean.remove_advanced_anomaly", rows="df")
     def remove_advanced_anomaly(self):
         """
         function which removes advanced anomaly in data based 
@@ -241,64 +476,354 @@ class MakeDataset:
         main_categories = self.select_allowed_options("main_category")
         categories = self.select_allowed_options("category")
         main_sub_categories = {main_categories[i]: categories[i]+[main_categories[i]] for i in range(len(main_categories))}
+        # table of the valid (main_category, category) pairs
+        valid_pairs = pd.MultiIndex.from_tuples([(main_category, category) 
+                                                 for main_category, sub_categories in main_sub_categories.items() 
+                                                 for category in sub_categories])
 
 
         # check if compaign period is between 1-60 days
         self.df['campaign_period'] = (self.df['deadline'] - self.df['launched']).dt.total_seconds()
+        n_rows = len(self.df)
         self.df = self.df[self.df['campaign_period']<= (60*24*60*60)]
+        count_rule("campaign_period over 60 days or missing", n_rows - len(self.df))
         self.df['campaign_period'] = self.df['campaign_period']//86400
         
         # check if category and main_category columns are compatible
-        self.df['category'] = self.df.apply(lambda x: x.category if x.category in main_sub_categories[x.main_category] else 
-                              x.main_category, axis=1)
+        # otherwise the category is replaced by the main_category
+        is_valid = pd.MultiIndex.from_arrays([self.df['main_category'], self.df['category']]).isin(valid_pairs)
+        category = self.df['category']
+        main_category = self.df['main_category']
+        if isinstance(category.dtype, pd.CategoricalDtype):
+            # both columns need the same categories
+            if isinstance(main_category.dtype, pd.CategoricalDtype):
+                main_categories = main_category.cat.categories
+            else:
+                main_categories = pd.Index(main_category.dropna().unique())
+            category = category.cat.add_categories(main_categories.difference(category.cat.categories))
+            main_category = main_category.astype(category.dtype)
+        self.df['category'] = category.where(is_valid, main_category)
+        count_rule("category replaced by main_category", (~is_valid).sum())
     
     
     
-    def clean_dataset(self):
+    @step("clean.clean_rows", rows="df")
+    def clean_rows(self):
+        """
+        function which runs the cleaning steps that only depend 
+        on the values of each row.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.workers > 1:
+            # steps 2-4 on partitions of the rows in parallel
+            self.remove_row_anomalies_parallel()
+        else:
+            # step 2: removing unconsistent values in each column separately
+            self.remove_basic_anomaly()
+            
+            # step 3: removing unnecessary rows based on previous analysis
+            self.remove_unnecessary_rows()
+            
+            # step 4: removing advanced anomaly in data based on some columns relationships
+            self.remove_advanced_anomaly()
+        
+        # step 5: filing nan values which can be deducted from other columns
+        # (done in this process since the missing exchange rates may be imported)
+        self.fill_nans()
+    
+    def remove_row_anomalies_parallel(self):
+        """
+        function which splits self.df into self.workers partitions and runs 
+        the steps 2-4 of the cleaning on each partition in the pool of processes.
+        The clean partitions are concatenated in their original order so that 
+        the result is identical to the serial cleaning.
+
+        Returns
+        -------
+        None.
+
+        """
+        bounds = np.linspace(0, len(self.df), self.workers + 1).astype(int)
+        partitions = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            # shallow copy of self with only the rows of the partition
+            partition = copy.copy(self)
+            partition.df = self.df.iloc[start:end]
+            partition.anomaly_report = dict()
+            partition.executor = None
+            partitions.append(partition)
+        
+        # the workers record their steps when the instrumentation is on here
+        instrumented = [active_recorder() != None]*len(partitions)
+        if self.executor == None:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(clean_partition, partitions, instrumented))
+        else:
+            results = list(self.executor.map(clean_partition, partitions, instrumented))
+        
+        # empty partitions would change the dtypes of the concatenation
+        frames = [df for df, _, _ in results if len(df) > 0] or [results[0][0]]
+        self.df = pd.concat(frames)
+        for _, anomaly_report, records in results:
+            for column, report in anomaly_report.items():
+                total = self.anomaly_report.setdefault(column, {"rule": report["rule"], "rejected": 0, "seconds": 0.0})
+                total["rejected"] += report["rejected"]
+                total["seconds"] += report["seconds"]
+            emit_records(records)
+    
+    def clean_dataset(self, incremental = False):
         """
         function which turns original dataset into a clean one.
+        In streaming mode (chunksize specified) the original dataset is 
+        cleaned chunk by chunk and each clean chunk is appended to the csvFile.
+        
+        Parameters
+        ----------
+        incremental : bool, optional
+            Only clean the rows that are new or modified since the 
+            previous run. The default is False.
 
         Returns
         -------
         Pandas dataFrame
-            Clean dataframe
+            Clean dataframe, None in streaming mode
 
         """
-        # step 1: removing columns with mostly missing values
-        self.remove_unnecessary_columns()
+        if self.workers > 1 and self.executor == None:
+            # the same pool of processes is used for all the chunks
+            with ProcessPoolExecutor(max_workers=self.workers) as self.executor:
+                try:
+                    return self.run_clean_dataset(incremental)
+                finally:
+                    self.executor = None
+        return self.run_clean_dataset(incremental)
+    
+    @step("clean.clean_dataset", rows="df")
+    def run_clean_dataset(self, incremental = False):
+        """
+        function which runs the cleaning of clean_dataset, once the pool 
+        of processes is opened.
+
+        Returns
+        -------
+        Pandas dataFrame
+            Clean dataframe, None in streaming mode
+
+        """
+        if incremental and self.engine == "polars":
+            raise ValueError("The incremental cleaning is only available with the pandas engine")
         
-        # step 2: removing unconsistent values in each column separately
-        self.remove_basic_anomaly()
+        if incremental:
+            return self.clean_dataset_incremental()
         
-        # step 3: removing unnecessary rows based on previous analysis
-        self.remove_unnecessary_rows()
+        if self.engine == "polars":
+            return self.clean_dataset_polars()
         
-        # step 4: removing advanced anomaly in data based on some columns relationships
-        self.remove_advanced_anomaly()
+        if self.chunksize != None:
+            return self.clean_dataset_streaming()
         
-        # step 5: filing nan values which can be deducted from other columns
+        # step 1: removing columns with mostly missing values
+        self.remove_unnecessary_columns()
+        
+        # steps 2-5: cleaning the rows
+        self.clean_rows()
+        
+        # store clean dataframe
+        self.storage.write(self.df, "clean")
+        self.print_anomaly_report()
+        print("Cleaning is Done. You can find the file in", self.storage.relative_path("clean"))
+
+        return self.df
+    
+    @step("clean.polars_query", rows="df")
+    def run_polars_query(self):
+        """
+        function which runs the steps 1-4 of the cleaning as one lazy 
+        polars query (see src.data.polars_engine) and reports its counts.
+
+        Returns
+        -------
+        None.
+
+        """
+        from src.data.polars_engine import run_clean_plan
+        self.df, counts, columns = run_clean_plan(self)
+        count_rule("columns dropped", len(columns))
+        # same order as remove_basic_anomaly, the positions are the ones of the kept columns
+        names = list(self.df.columns)
+        rules = [(names[index], "numerical") for index in self.allowed_values["numerical"]]
+        rules += [(names[index], "dateTime") for index in self.allowed_values["dateTime"]]
+        rules += [(names[index], "values") for index, _ in self.allowed_values["values"]]
+        for column, rule in rules:
+            report = self.anomaly_report.setdefault(column, {"rule": rule, "rejected": 0, "seconds": None})
+            report["rejected"] += counts[column]
+            count_rule("{} ({})".format(column, rule), counts[column])
+        count_rule("state canceled, live or suspended", counts["__state__"])
+        count_rule("missing category", counts["__category__"])
+        count_rule("campaign_period over 60 days or missing", counts["__period__"])
+        count_rule("category replaced by main_category", counts["__pair__"])
+    
+    def clean_dataset_polars(self):
+        """
+        function which turns original dataset into a clean one with the
+        polars engine: the steps 1-4 run as one query, the step 5 (which may
+        import missing exchange rates) runs on its result.
+
+        Returns
+        -------
+        Pandas dataFrame
+            Clean dataframe
+
+        """
+        self.run_polars_query()
         self.fill_nans()
+        self.storage.write(self.df, "clean")
+        self.print_anomaly_report()
+        print("Cleaning is Done. You can find the file in", self.storage.relative_path("clean"))
+        return self.df
+    
+    def clean_dataset_streaming(self):
+        """
+        function which turns original dataset into a clean one by reading it
+        in chunks of self.chunksize rows, so that only one chunk is in memory.
+        Each clean chunk is appended to the stored clean dataset.
+
+        Returns
+        -------
+        None.
+
+        """
+        # step 1: columns with mostly missing values are selected 
+        # with a first pass over the whole dataset
+        missing_counts, n_rows = self.count_missing_values()
+        columns = self.unnecessary_columns(missing_counts, n_rows)
+        
+        writer = self.storage.writer("clean")
+        for chunk in self.original_chunks():
+            self.df = chunk
+            self.remove_unnecessary_columns(columns)
+            self.clean_rows()
+            # append clean chunk to the stored dataset
+            writer.write(self.df)
+        writer.close()
         
-        # store clean dataframe into a csvFile
-        csvPath = os.path.join(self.project_dir,"data","clean.csv")
-        self.df.to_csv(csvPath)
-        print("Cleaning is Done. You can find the csvFile in data/clean.csv")
+        # free the last chunk
+        self.df = None
+        self.print_anomaly_report()
+        print("Cleaning is Done. You can find the file in", self.storage.relative_path("clean"))
+    
+    def clean_dataset_incremental(self):
+        """
+        function which only cleans the rows of the original dataset that are 
+        new or modified since the previous run and merges them into the 
+        stored clean dataset. The rows are fingerprinted by their ID and 
+        the hash of their values (see src.data.incremental).
+        The whole dataset is cleaned again if the columns to drop or 
+        the allowed values changed.
 
+        Returns
+        -------
+        Pandas dataFrame
+            Clean dataframe
+
+        """
+        # first pass: fingerprints of the rows and missing values of the columns
+        fingerprints = []
+        missing_counts = None
+        n_rows = 0
+        for chunk in self.original_chunks():
+            fingerprints.append(row_fingerprints(chunk))
+            counts = chunk.isna().sum()
+            missing_counts = counts if missing_counts is None else missing_counts + counts
+            n_rows += len(chunk)
+        fingerprints = pd.concat(fingerprints, ignore_index=True)
+        columns = self.unnecessary_columns(missing_counts, n_rows)
+        
+        settings = {"dropped_columns": columns, "allowed_values": self.allowed_values}
+        previous = read_fingerprints(self.storage, settings)
+        if previous is None:
+            # nothing can be reused
+            changed_ids = fingerprints["ID"].unique()
+            kept = []
+        else:
+            changed_ids, labels = compare_fingerprints(previous, fingerprints)
+            clean = self.storage.read("clean", index_col=0)
+            kept = clean[~clean["ID"].isin(changed_ids)]
+            # the unchanged rows take the position they have in the current original dataset
+            kept.index = labels.reindex(kept.index).to_numpy()
+            kept = [kept]
+        
+        # second pass: cleaning of the rows of the new and modified IDs
+        cleaned = []
+        n_delta = 0
+        for chunk in self.original_chunks():
+            self.df = chunk[chunk["ID"].isin(changed_ids)].copy()
+            n_delta += len(self.df)
+            self.remove_unnecessary_columns(columns)
+            self.clean_rows()
+            cleaned.append(self.df)
+        
+        # merge the clean rows into the stored clean dataset
+        self.df = pd.concat(kept + cleaned).sort_index()
+        self.storage.write(self.df, "clean")
+        write_fingerprints(self.storage, fingerprints, settings)
+        self.print_anomaly_report()
+        print("{} new or modified rows out of {} were cleaned.".format(n_delta, n_rows))
+        print("Cleaning is Done. You can find the file in", self.storage.relative_path("clean"))
+        
         return self.df
     
-    def get_clean_df(self):
+    def get_clean_df(self, columns = None):
         """
         function which return cleaned dataframe if the clean file exists in the data folder
 
+        Parameters
+        ----------
+        columns : list, optional
+            Columns to read. The default is all the columns.
+
         Returns
         -------
         Pandas dataFrame
             Clean dataFrame if exists otherwise None.
 
         """
-        csvPath = os.path.join(self.project_dir,"data","clean.csv")
-        if os.path.exists(csvPath):
-            return pd.read_csv(csvPath)
+        if self.storage.exists("clean"):
+            return self.storage.read("clean", columns = columns)
         else:
             print("The clean version of data doesn't exist, you have to run Data Wrangling section")
-            return None
\ No newline at end of file
+            return None
+
+
+def clean_partition(makeData, instrumented = False):
+    """
+    function run by the processes of MakeDataset.remove_row_anomalies_parallel
+    on one partition of the rows.
+
+    Parameters
+    ----------
+    makeData : MakeDataset
+        Copy of the MakeDataset instance holding the partition in its df.
+    instrumented : bool, optional
+        Record the steps, the records are returned to the parent process.
+        The default is False.
+
+    Returns
+    -------
+    Pandas dataFrame
+        Partition after the steps 2-4 of the cleaning.
+    dictionary
+        Anomaly report of the partition.
+    list
+        Records of the steps (empty if not instrumented).
+
+    """
+    with instrument() if instrumented else contextlib.nullcontext() as recorder:
+        makeData.remove_basic_anomaly()
+        makeData.remove_unnecessary_rows()
+        makeData.remove_advanced_anomaly()
+    return makeData.df, makeData.anomaly_report, list(recorder.sink) if recorder != None else []
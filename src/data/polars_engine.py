@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Nov 23 10:27:54 2022
+
+@author: fatima-zahrabanani
+
+Polars engine of MakeDataset: the steps 1-4 of clean_dataset (unnecessary
+columns, basic anomalies, unnecessary rows, advanced anomalies) are one
+lazy query on the original csvFile. Polars fuses the projections and the
+filters and runs the query on all the cores, without the intermediate
+copies of the dataFrame made by the pandas steps. The counts of the
+anomaly report are computed by a second query sharing the cached rows.
+
+A first pass counts the missing values (step 1) and the values of each
+column that are not integers or numbers, so the columns get the types of
+pd.read_csv. With the same missing value markers, invalid values becoming
+missing and the kept rows keeping their position in the original dataset
+as index, the clean dataset is the one of the pandas engine.
+"""
+import polars as pl
+import pandas as pd
+import os
+
+# strings read as missing values by pd.read_csv
+PANDAS_NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+                    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+
+# column of the position of each row in the original dataset
+INDEX_COLUMN = "__index__"
+
+# separator of the (main_category, category) keys
+PAIR_SEPARATOR = "\x1f"
+
+
+def scan_original(csvPath):
+    """
+    function which scans the original dataset, as strings, and renames its 
+    columns by deleting extra space, like MakeDataset.read_original.
+
+    Returns
+    -------
+    Polars LazyFrame
+
+    """
+    lazy = pl.scan_csv(csvPath, null_values=PANDAS_NA_VALUES, infer_schema=False, row_index_name=INDEX_COLUMN)
+    return lazy.rename({col: col.strip().replace(" ","_") for col in lazy.collect_schema().names() if col != INDEX_COLUMN})
+
+
+def column_statistics(lazy):
+    """
+    function which counts, with one pass over the dataset, the missing 
+    values of each column and the values that are not integers or numbers,
+    from which the columns get the type pd.read_csv would give them.
+
+    Returns
+    -------
+    Pandas Series
+        Number of missing values for each column.
+    int
+        Total number of rows.
+    dictionary
+        column -> polars type (Int64, Float64 or String).
+
+    """
+    names = [col for col in lazy.collect_schema().names() if col != INDEX_COLUMN]
+    statistics = lazy.select([expression for col in names for expression in (
+        pl.col(col).null_count().alias(col + "|missing"),
+        pl.col(col).cast(pl.Int64, strict=False).null_count().alias(col + "|Int64"),
+        pl.col(col).cast(pl.Float64, strict=False).null_count().alias(col + "|Float64"))] + [pl.len().alias(INDEX_COLUMN)]).collect().row(0, named=True)
+    counts = pd.Series({col: statistics[col + "|missing"] for col in names})
+    types = dict()
+    for col in names:
+        # an integer column with missing values is read as floats
+        if statistics[col + "|Int64"] == 0:
+            types[col] = pl.Int64
+        elif statistics[col + "|Float64"] == counts[col]:
+            types[col] = pl.Float64
+        else:
+            types[col] = pl.String
+    return counts, statistics[INDEX_COLUMN], types
+
+
+def clean_plan(lazy, columns, allowed_values, valid_pairs, types):
+    """
+    function which builds the queries of the steps 1-4 of the cleaning.
+
+    Parameters
+    ----------
+    lazy : Polars LazyFrame
+        Scan of the original dataset (see scan_original).
+    columns : list
+        Columns to drop (step 1).
+    allowed_values : dictionary
+        MakeDataset.allowed_values, the columns are given by their position
+        once the columns are dropped.
+    valid_pairs : list
+        Valid (main_category, category) pairs.
+    types : dictionary
+        column -> polars type of the column (see column_statistics).
+
+    Returns
+    -------
+    Polars LazyFrame
+        Clean rows.
+    Polars LazyFrame
+        One row with the counts of the anomaly report.
+
+    """
+    names = [col for col in lazy.collect_schema().names() if col != INDEX_COLUMN and col not in columns]
+    lazy = lazy.select([INDEX_COLUMN] + [pl.col(col).cast(types[col]) for col in names])
+
+    # step 2: non consistent values are replaced by null
+    validated = dict()
+    schema = lazy.collect_schema()
+    for index in allowed_values["numerical"]:
+        col = names[index]
+        validated[col] = pl.col(col) if schema[col].is_numeric() else pl.col(col).cast(pl.Float64, strict=False)
+    for index in allowed_values["dateTime"]:
+        col = names[index]
+        validated[col] = pl.col(col).str.to_datetime(strict=False) if schema[col] == pl.String else pl.col(col).cast(pl.Datetime, strict=False)
+    for index, values in allowed_values["values"]:
+        col = names[index]
+        values = [str(value) for value in values] if schema[col] == pl.String else list(values)
+        validated[col] = pl.when(pl.col(col).is_in(values)).then(pl.col(col))
+    rejected = {col: (pl.col(col).is_not_null() & expression.is_null()).sum().alias(col) for col, expression in validated.items()}
+
+    # flags of the rows kept by the steps 3 and 4, in their order
+    seconds = (pl.col("deadline") - pl.col("launched")).dt.total_seconds().cast(pl.Float64)
+    keys = [PAIR_SEPARATOR.join(pair) for pair in valid_pairs]
+    # the flags are computed once for the clean rows and the report
+    flags = lazy.with_columns(**validated).with_columns(
+        __state__ = pl.col("state").is_in(["failed","successful","undefined"]) | pl.col("state").is_null(),
+        __category__ = pl.col("category").is_not_null(),
+        __period__ = (seconds <= 60*24*60*60).fill_null(False),
+        __pair__ = pl.concat_str([pl.col("main_category"), pl.col("category")], separator=PAIR_SEPARATOR).is_in(keys).fill_null(False)).cache()
+
+    clean = (flags.filter(pl.col("__state__") & pl.col("__category__") & pl.col("__period__"))
+                  .with_columns(category = pl.when(pl.col("__pair__")).then(pl.col("category")).otherwise(pl.col("main_category")),
+                                campaign_period = seconds // 86400)
+                  .select([INDEX_COLUMN] + names + ["campaign_period"]))
+
+    report = lazy.select(**rejected).join(flags.select(
+        __state__ = (~pl.col("__state__")).sum(),
+        __category__ = (pl.col("__state__") & ~pl.col("__category__")).sum(),
+        __period__ = (pl.col("__state__") & pl.col("__category__") & ~pl.col("__period__")).sum(),
+        __pair__ = (pl.col("__state__") & pl.col("__category__") & pl.col("__period__") & ~pl.col("__pair__")).sum()), how="cross")
+    return clean, report
+
+
+def run_clean_plan(makeData, csvPath = None):
+    """
+    function which runs the steps 1-4 of the cleaning of a MakeDataset
+    with polars.
+
+    Parameters
+    ----------
+    makeData : MakeDataset
+        Settings of the cleaning (missing_values_percent, allowed_values, references).
+    csvPath : str, optional
+        Original dataset. The default is data/original.csv.
+
+    Returns
+    -------
+    Pandas dataFrame
+        Rows after the step 4, indexed by their position in the original dataset.
+    dictionary
+        Counts of the rules: column -> values rejected by remove_basic_anomaly,
+        and the rows removed or modified by the other steps.
+    list
+        Dropped columns.
+
+    """
+    csvPath = csvPath if csvPath != None else os.path.join(makeData.project_dir,"data","original.csv")
+    lazy = scan_original(csvPath)
+
+    # step 1: columns with mostly missing values
+    counts, n_rows, types = column_statistics(lazy)
+    columns = makeData.unnecessary_columns(counts, n_rows)
+
+    main_categories = makeData.select_allowed_options("main_category")
+    categories = makeData.select_allowed_options("category")
+    valid_pairs = [(main_category, category) for main_category, sub_categories in zip(main_categories, categories)
+                   for category in sub_categories + [main_category]]
+
+    clean, report = clean_plan(lazy, columns, makeData.allowed_values, valid_pairs, types)
+    clean, report = pl.collect_all([clean, report])
+
+    df = clean.to_pandas()
+    df.index = pd.Index(df.pop(INDEX_COLUMN).to_numpy(dtype="int64"))
+    return df, report.row(0, named=True), columns
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 25 10:12:31 2022
+
+@author: fatima-zahrabanani
+"""
+import functools
+import hashlib
+import copy
+import json
+import os
+import re
+
+# name of the file, inside the references folder, where the parsed options are stored
+CACHE_FILE = ".options_cache.json"
+
+# options already parsed by the current process
+# keys -> values:
+    # (html file, parent tag, child tag) -> (file signature, list of options)
+_options_memory = dict()
+
+
+@functools.lru_cache(maxsize=None)
+def country_codes():
+    """
+    function which maps the names of the countries to their alpha_2 code.
+
+    Returns
+    -------
+    dictionary country name -> alpha_2 code
+
+    """
+    import pycountry
+    return {country.name: country.alpha_2 for country in pycountry.countries}
+
+
+def parse_options(html, column, parent, child):
+    """
+    function parsing the html element from the website source code
+    in order to get all the options of a column value.
+
+    Parameters
+    ----------
+    html : str
+        html source code.
+    column : str
+        column name
+    parent : str
+        tag containing the options.
+    child : str
+        tag of each option.
+
+    Returns
+    -------
+    list of options of the column
+
+    """
+    # only needed when the options are not cached
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html,'html.parser')
+    subject_options = [i.findAll(child) for i in soup.findAll(parent)]
+    subject_options = [[re.sub("<.*?>", "", str(option).replace("&amp;","&")) for option in subject_option] for subject_option in subject_options]
+
+    if column == "country":
+        # the options in countries are the names but in the csvFile
+        # they are specified as the 2_alpha code
+        # so we turn the names into their coresponding alpha_2 code
+        countries = country_codes()
+        subject_options = [countries.get(country.replace("the ", ""), 'Unknown code') for country in subject_options[0]]
+
+    if column == "currency":
+        # only keep the currency 3 characters code which is between parentheses
+        subject_options = [value.strip().split('(')[-1][:-1] for value in subject_options[0]]
+
+    if column == "main_category":
+        subject_options = subject_options[0][1:]
+
+    if len(subject_options)==1:
+        return subject_options[0]
+
+    return subject_options
+
+
+def read_cache(cachePath):
+    """
+    function which reads the options stored on disk.
+
+    Returns
+    -------
+    dictionary column -> cache entry, empty if the cache doesn't exist or is corrupted
+
+    """
+    try:
+        with open(cachePath, 'r') as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return dict()
+
+
+def write_cache(cachePath, cache):
+    """
+    function which stores the options on disk. The file is replaced
+    atomically so that concurrent runs never read a partial cache.
+
+    Returns
+    -------
+    None.
+
+    """
+    tmpPath = "{}.{}.tmp".format(cachePath, os.getpid())
+    try:
+        with open(tmpPath, 'w') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(tmpPath, cachePath)
+    except OSError:
+        # the cache is only an optimization (e.g. read-only references folder)
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+
+def load_options(project_dir, column, parent, child):
+    """
+    function which returns the options of a column value from the
+    references folder. Each html file is parsed once per process and
+    the options are stored in references/.options_cache.json. The stored
+    options are used as long as the html file has the same modification
+    time and size, or the same content hash.
+
+    Parameters
+    ----------
+    project_dir : str
+        directory of the project.
+    column : str
+        column name
+    parent : str
+        tag containing the options.
+    child : str
+        tag of each option.
+
+    Returns
+    -------
+    list of options of the column
+
+    """
+    htmlFile = os.path.join(project_dir,"references",column+".txt")
+    stat = os.stat(htmlFile)
+    signature = [stat.st_mtime_ns, stat.st_size]
+
+    # options already parsed by this process
+    key = (os.path.abspath(htmlFile), parent, child)
+    if key in _options_memory and _options_memory[key][0] == signature:
+        return copy.deepcopy(_options_memory[key][1])
+
+    cachePath = os.path.join(project_dir,"references",CACHE_FILE)
+    cache = read_cache(cachePath)
+    entry = cache.get(column)
+    if entry != None and entry["tags"] != [parent, child]:
+        entry = None
+
+    if entry == None or entry["signature"] != signature:
+        with open(htmlFile, 'rb') as html_file:
+            content = html_file.read()
+        content_hash = hashlib.sha256(content).hexdigest()
+
+        if entry == None or entry["sha256"] != content_hash:
+            options = parse_options(content.decode(), column, parent, child)
+            entry = {"tags": [parent, child], "sha256": content_hash, "options": options}
+        # same content with a new modification time
+        entry["signature"] = signature
+        cache[column] = entry
+        write_cache(cachePath, cache)
+
+    _options_memory[key] = (signature, entry["options"])
+    return copy.deepcopy(entry["options"])
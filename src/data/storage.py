@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 28 11:20:05 2022
+
+@author: fatima-zahrabanani
+"""
+import pandas as pd
+import os
+
+# file extension of each storage format
+EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+
+class Storage:
+    """
+    class responsible of writing and reading the datasets passed between
+    the stages of the pipeline (data/clean, data/processed). The columnar
+    formats (parquet, feather) keep the dtypes (datetimes, categories, int codes),
+    can read only some columns and can be memory-mapped.
+    """
+    def __init__(self, project_dir, file_format = "csv", export_csv = False, memory_map = False):
+        if file_format not in EXTENSIONS:
+            raise ValueError("Unknown storage format {}, expected one of {}".format(file_format, list(EXTENSIONS)))
+        self.project_dir = project_dir
+        self.file_format = file_format
+        # also write a csvFile next to the columnar file
+        self.export_csv = export_csv and file_format != "csv"
+        # default of read for the columnar formats
+        self.memory_map = memory_map
+
+    def path(self, name, file_format = None):
+        """
+        function which returns the path of a dataset in the data folder.
+
+        Parameters
+        ----------
+        name : str
+            Name of the dataset (e.g. "clean", "processed").
+        file_format : str, optional
+            Storage format. The default is self.file_format.
+
+        Returns
+        -------
+        str
+
+        """
+        file_format = self.file_format if file_format == None else file_format
+        return os.path.join(self.project_dir,"data",name+EXTENSIONS[file_format])
+
+    def relative_path(self, name):
+        return os.path.relpath(self.path(name), self.project_dir)
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def write(self, df, name, index = True):
+        """
+        function which stores a dataFrame.
+
+        Parameters
+        ----------
+        df : Pandas dataFrame
+            dataFrame to store.
+        name : str
+            Name of the dataset.
+        index : bool, optional
+            Store the index of the dataFrame. The default is True.
+
+        Returns
+        -------
+        None.
+
+        """
+        writer = self.writer(name, index)
+        writer.write(df)
+        writer.close()
+
+    def writer(self, name, index = True):
+        """
+        function which returns a writer storing a dataset chunk by chunk.
+
+        Returns
+        -------
+        ChunkWriter
+
+        """
+        writers = [ChunkWriter(self.path(name), self.file_format, index)]
+        if self.export_csv:
+            writers.append(ChunkWriter(self.path(name, "csv"), "csv", index))
+        return writers[0] if len(writers) == 1 else MultiWriter(writers)
+
+    def read(self, name, columns = None, memory_map = None, index_col = None):
+        """
+        function which reads a stored dataset.
+
+        Parameters
+        ----------
+        name : str
+            Name of the dataset.
+        columns : list, optional
+            Columns to read. The default is all the columns.
+        memory_map : bool, optional
+            Memory-map the file instead of reading it (parquet, feather).
+            The default is self.memory_map.
+        index_col : int or str, optional
+            Column used as index when reading a csvFile, the columnar 
+            formats restore their stored index.
+
+        Returns
+        -------
+        Pandas dataFrame
+
+        """
+        memory_map = self.memory_map if memory_map == None else memory_map
+        path = self.path(name)
+        if self.file_format == "csv":
+            return pd.read_csv(path, usecols=columns, index_col=index_col)
+        if self.file_format == "parquet":
+            import pyarrow.parquet as pq
+            table = pq.read_table(path, columns=columns, memory_map=memory_map, use_pandas_metadata=True)
+        else:
+            import pyarrow.feather as feather
+            table = feather.read_table(path, columns=columns, memory_map=memory_map)
+        return table.to_pandas()
+
+    def read_chunks(self, name, columns = None, chunksize = 100000):
+        """
+        function which reads a stored dataset by chunks of rows,
+        without loading it whole.
+
+        Parameters
+        ----------
+        name : str
+            Name of the dataset.
+        columns : list, optional
+            Columns to read. The default is all the columns.
+        chunksize : int, optional
+            Maximum number of rows of a chunk. The default is 100000.
+
+        Returns
+        -------
+        iterator of Pandas dataFrames
+
+        """
+        path = self.path(name)
+        if self.file_format == "csv":
+            with pd.read_csv(path, usecols=columns, chunksize=chunksize) as reader:
+                yield from reader
+        elif self.file_format == "parquet":
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunksize, columns=columns):
+                yield batch.to_pandas()
+        else:
+            import pyarrow as pa
+            # the record batches of the memory-mapped file are sliced, not copied
+            reader = pa.ipc.open_file(pa.memory_map(path))
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns != None:
+                    batch = batch.select(columns)
+                for start in range(0, batch.num_rows, chunksize):
+                    yield batch.slice(start, chunksize).to_pandas()
+
+
+class ChunkWriter:
+    """
+    class writing a dataset in one file, chunk by chunk
+    """
+    def __init__(self, path, file_format, index = True):
+        self.path = path
+        self.file_format = file_format
+        self.index = index
+        self.writer = None
+        self.schema = None
+        self.chunks = 0
+
+    def write(self, df):
+        if self.file_format == "csv":
+            df.to_csv(self.path, mode = 'w' if self.chunks == 0 else 'a', header = (self.chunks == 0), index = self.index)
+        else:
+            import pyarrow as pa
+            # the next chunks are converted to the schema of the first one
+            table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=self.index)
+            if self.writer == None:
+                self.schema = table.schema
+                if self.file_format == "parquet":
+                    import pyarrow.parquet as pq
+                    self.writer = pq.ParquetWriter(self.path, self.schema)
+                else:
+                    # feather V2 is the arrow IPC file format, uncompressed so it can be memory-mapped
+                    self.writer = pa.ipc.new_file(self.path, self.schema)
+            self.writer.write_table(table)
+        self.chunks += 1
+
+    def close(self):
+        if self.writer != None:
+            self.writer.close()
+            self.writer = None
+
+
+class MultiWriter:
+    """
+    class writing the same dataset with several ChunkWriter
+    """
+    def __init__(self, writers):
+        self.writers = writers
+
+    def write(self, df):
+        for writer in self.writers:
+            writer.write(df)
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Nov 15 10:06:35 2022
+
+@author: fatima-zahrabanani
+
+Seeded generator of a synthetic original.csv with the schema of the
+Kickstarter dataset, used to measure the performance of the workflow.
+
+    python -m src.data.synthetic --scale 100
+"""
+from src.data.references import load_options
+import pandas as pd
+import numpy as np
+import argparse
+import os
+
+# rows written for a scale of 1
+BASE_ROWS = 10000
+
+# header of the original dataset, in the order the column indices of
+# MakeDataset.set_allowed_values rely on (the names end with a space)
+ORIGINAL_COLUMNS = ["ID ", "name ", "category ", "main_category ", "currency ", "deadline ", "goal ",
+                    "launched ", "pledged ", "state ", "backers ", "country ", "usd pledged ",
+                    "Unnamed: 13", "Unnamed: 14", "Unnamed: 15", "Unnamed: 16"]
+
+# ID of the first project
+FIRST_ID = 10**6
+
+# states of the projects and their frequencies
+STATES = ['failed', 'successful', 'canceled', 'live', 'undefined', 'suspended']
+STATE_FREQUENCIES = [0.52, 0.35, 0.10, 0.01, 0.01, 0.01]
+
+# fraction of the rows receiving each anomaly
+# keys -> values:
+    # column -> (fraction, injected value)
+ANOMALIES = {"goal ": (0.005, "abc"), "pledged ": (0.002, "?"), "backers ": (0.002, "many"),
+             "category ": (0.005, "Unknown"), "currency ": (0.002, "XXX"), "country ": (0.003, 'N,0"'),
+             "deadline ": (0.002, "not a date"), "state ": (0.001, "0")}
+
+# fraction of missing values of each column
+MISSING = {"name ": 0.0001, "category ": 0.002, "usd pledged ": 0.01}
+
+
+def generate_chunk(options, n_rows, first_id, rng):
+    """
+    function which generates n_rows projects of the original dataset.
+
+    Parameters
+    ----------
+    options : dictionary
+        column -> options read from the references folder.
+    n_rows : int
+        Number of rows.
+    first_id : int
+        Number of the first project, used in its ID and its name.
+    rng : numpy Generator
+        Seeded random generator.
+
+    Returns
+    -------
+    Pandas dataFrame
+
+    """
+    main_categories = np.array(options["main_category"], dtype=object)
+    main_index = rng.integers(0, len(main_categories), n_rows)
+
+    # sub-category of the main category (the first two options are placeholders),
+    # or the main category itself for a tenth of the projects
+    sub_categories = [np.array(options["category"][i][2:], dtype=object) for i in range(len(main_categories))]
+    choice = rng.random(n_rows)
+    category = np.empty(n_rows, dtype=object)
+    for i, subs in enumerate(sub_categories):
+        rows = main_index == i
+        category[rows] = subs[(choice[rows]*len(subs)).astype(int)] if len(subs) > 0 else main_categories[i]
+    is_main = rng.random(n_rows) < 0.1
+    category[is_main] = main_categories[main_index[is_main]]
+
+    launched = pd.Timestamp("2009-05-01") + pd.to_timedelta(rng.integers(0, 8*365*86400, n_rows), unit="s")
+    # some campaigns last more than the 60 days allowed by remove_advanced_anomaly
+    deadline = launched + pd.to_timedelta(rng.integers(86400, 70*86400, n_rows), unit="s")
+    goal = np.round(rng.lognormal(8.5, 1.3, n_rows))
+    pledged = np.round(goal*rng.lognormal(-0.7, 1.2, n_rows), 2)
+    currency = np.array(options["currency"], dtype=object)[rng.integers(0, len(options["currency"]), n_rows)]
+
+    df = pd.DataFrame({
+        # unique IDs, the out-of-core training splits the rows by their ID
+        "ID ": FIRST_ID + np.arange(first_id, first_id + n_rows),
+        "name ": np.char.add("project ", np.arange(first_id, first_id + n_rows).astype(str)).astype(object),
+        "category ": category,
+        "main_category ": main_categories[main_index],
+        "currency ": currency,
+        "deadline ": deadline.strftime("%Y-%m-%d %H:%M:%S"),
+        "goal ": goal,
+        "launched ": launched.strftime("%Y-%m-%d %H:%M:%S"),
+        "pledged ": pledged,
+        "state ": np.array(STATES, dtype=object)[rng.choice(len(STATES), n_rows, p=STATE_FREQUENCIES)],
+        "backers ": rng.poisson(pledged/80),
+        "country ": np.array(options["country"], dtype=object)[rng.integers(0, len(options["country"]), n_rows)],
+        "usd pledged ": np.round(pledged*rng.uniform(0.6, 1.4, n_rows), 6)}).astype(object)
+
+    for column, (fraction, value) in ANOMALIES.items():
+        df.loc[rng.random(n_rows) < fraction, column] = value
+    for column, fraction in MISSING.items():
+        df.loc[rng.random(n_rows) < fraction, column] = np.nan
+    # the trailing columns are almost empty, like in the original dataset
+    for column in ORIGINAL_COLUMNS[13:]:
+        df[column] = np.where(rng.random(n_rows) < 0.0005, "0", None)
+    return df[ORIGINAL_COLUMNS]
+
+
+def generate_original(project_dir, scale = 1, seed = 0, csvPath = None, chunksize = 1000000, html_parent_child = None):
+    """
+    function which writes a synthetic original dataset of scale*BASE_ROWS
+    rows, with the categories, currencies and countries of the references
+    folder, anomalies and missing values. The same seed and scale always
+    give the same file. The rows are generated and written by chunks.
+
+    Parameters
+    ----------
+    project_dir : str
+        Project directory.
+    scale : float, optional
+        Scale factor of the number of rows. The default is 1 (10000 rows).
+    seed : int, optional
+        Seed of the generator. The default is 0.
+    csvPath : str, optional
+        Written file. The default is data/original.csv.
+    chunksize : int, optional
+        Rows generated at once. The default is 1000000.
+    html_parent_child : dictionary, optional
+        column -> (parent tag, child tag) of the options in the references
+        folder. The default is the one of MakeDataset.
+
+    Returns
+    -------
+    int
+        Number of rows written.
+
+    """
+    if html_parent_child == None:
+        html_parent_child = {"category": ('select','option'), "main_category": ('select','option'),
+                             "currency": ('select','option'), "country": ('ul','li')}
+    options = {column: load_options(project_dir, column, parent, child) for column, (parent, child) in html_parent_child.items()}
+    csvPath = csvPath if csvPath != None else os.path.join(project_dir,"data","original.csv")
+    os.makedirs(os.path.dirname(csvPath), exist_ok=True)
+
+    n_rows = int(scale*BASE_ROWS)
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_rows, chunksize):
+        chunk = generate_chunk(options, min(chunksize, n_rows - start), start, rng)
+        chunk.to_csv(csvPath, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seeded generator of a synthetic original.csv")
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--project-dir", default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    parser.add_argument("--output", help="written file, data/original.csv by default")
+    args = parser.parse_args()
+    n_rows = generate_original(args.project_dir, args.scale, args.seed, args.output)
+    print("{} rows written to {}".format(n_rows, args.output or os.path.join("data","original.csv")))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,17 +5,155 @@ Created on Mon Oct 17 16:10:28 2022
 
 @author: fatima-zahrabanani
 """
-from sklearn import preprocessing
+import pandas as pd
 import numpy as np
+from src.data.storage import Storage
+from src.features.quantile_sketch import QuantileSketch
+from src.instrumentation import step, count_rule
+import json
 import os
 
+# code given to the categories that were not seen when fitting the encoders
+UNKNOWN_CODE = -1
+
+
+def iqr_bounds(Q1, Q3):
+    """
+    function returning the (lower, upper) bounds beyond which values are outliers.
+    """
+    IQR = Q3 - Q1
+    return Q1-1.5*IQR, Q3+1.5*IQR
+
+
+def sketch_outlier_bounds(chunks, columns, relative_accuracy = 0.01):
+    """
+    function that computes the IQR bounds of several columns in one pass 
+    over data read by chunks, with one mergeable QuantileSketch per column.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Pandas dataFrames (chunks or partitions of the data), or 
+        dictionaries column -> QuantileSketch already computed on partitions.
+    columns : list
+        Names of the columns studied.
+    relative_accuracy : float, optional
+        Relative accuracy of the quartiles. The default is 0.01.
+
+    Returns
+    -------
+    dictionary column -> (lower bound, upper bound)
+
+    """
+    sketches = {col: QuantileSketch(relative_accuracy) for col in columns}
+    for chunk in chunks:
+        for col in columns:
+            if isinstance(chunk, dict):
+                sketches[col].merge(chunk[col])
+            else:
+                sketches[col].update(chunk[col])
+    return {col: iqr_bounds(sketches[col].quantile(0.25), sketches[col].quantile(0.75)) for col in columns}
+
+
+class Encoders:
+    """
+    class storing the vocabulary of each categorical column and the classes 
+    of the target, so that new data is encoded the same way as the training data
+    """
+    def __init__(self, vocabularies = None, target = None, target_classes = None):
+        # dictionary column -> list of categories, the code of a category is its position
+        self.vocabularies = vocabularies if vocabularies != None else dict()
+        self.target = target
+        self.target_classes = target_classes
+        # index of each vocabulary, built on the first transform
+        self.indexes = dict()
+    
+    def fit_column(self, column, values):
+        # same order as the categories created by pandas
+        self.vocabularies[column] = list(pd.Index(values.dropna().unique()).sort_values())
+        self.indexes.pop(column, None)
+        
+    def transform_column(self, column, values):
+        """
+        function which encodes the values of a categorical column with its vocabulary.
+        Missing values and categories not in the vocabulary get UNKNOWN_CODE.
+
+        Returns
+        -------
+        numpy array of codes
+
+        """
+        if column not in self.indexes:
+            self.indexes[column] = pd.Index(self.vocabularies[column])
+        codes = self.indexes[column].get_indexer(values)
+        # same integer type as the codes of pandas categories
+        n_categories = len(self.vocabularies[column])
+        for dtype in (np.int8, np.int16, np.int32):
+            if n_categories < np.iinfo(dtype).max:
+                return codes.astype(dtype)
+        return codes
+    
+    def fit_target(self, target, values):
+        self.target = target
+        self.target_classes = list(np.unique(values))
+        
+    def transform_target(self, values):
+        codes = pd.Categorical(values, categories=self.target_classes).codes.astype("int64")
+        if (codes == UNKNOWN_CODE).any():
+            raise ValueError("The target contains classes that were not seen when fitting: {}".format(
+                list(pd.unique(values[codes == UNKNOWN_CODE]))))
+        return codes
+    
+    def inverse_target(self, codes):
+        return np.array(self.target_classes)[codes]
+    
+    def transform(self, df):
+        """
+        function which encodes the categorical columns (and the target if present)
+        of a new batch of data.
+
+        Parameters
+        ----------
+        df : Pandas dataFrame
+            New data.
+
+        Returns
+        -------
+        Pandas dataFrame
+            Encoded copy of the data.
+
+        """
+        df = df.copy()
+        for column in self.vocabularies:
+            if column in df.columns:
+                df[column] = self.transform_column(column, df[column])
+        if self.target in df.columns:
+            df[self.target] = self.transform_target(df[self.target])
+        return df
+    
+    def save(self, path):
+        with open(path, 'w') as encoders_file:
+            json.dump({"vocabularies": self.vocabularies, "target": self.target, 
+                       "target_classes": self.target_classes}, encoders_file, default=str)
+    
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as encoders_file:
+            return cls(**json.load(encoders_file))
+
+
 class BuildFeatures:
     """
     class containing methods to build features that can be used with the ML model
     """
-    def __init__(self,df,project_dir):
+    def __init__(self,df,project_dir,storage=None):
         self.df = df
         self.project_dir = project_dir
+        # storage of the processed dataset
+        # if not specified the dataset is stored in data/processed.csv
+        self.storage = storage if storage != None else Storage(self.project_dir)
+        # encoders fitted by feature_encoding and target_encoding
+        self.encoders = Encoders()
         
     def drop_outliers(self,column):
         """
@@ -32,21 +170,72 @@ class BuildFeatures:
         None.
 
         """
-        Q1 = np.percentile(self.df[column], 25,
-                   interpolation = 'midpoint')
- 
-        Q3 = np.percentile(self.df[column], 75,
-                   interpolation = 'midpoint')
-        IQR = Q3 - Q1
-        # Upper bound
-        upper = np.where(self.df[column] >= (Q3+1.5*IQR))
-        # Lower bound
-        lower = np.where(self.df[column] <= (Q1-1.5*IQR))
+        self.drop_outliers_columns([column])
+        
+    def outlier_bounds(self,columns):
+        """
+        function that computes the IQR bounds of several columns
+        with one percentile computation.
+
+        Parameters
+        ----------
+        columns : list
+            Names of the columns studied.
+
+        Returns
+        -------
+        dictionary column -> (lower bound, upper bound)
+
+        """
+        # missing values are ignored, as in the sketches
+        Q1, Q3 = np.nanpercentile(self.df[columns].to_numpy(dtype=float), [25, 75],
+                                  axis=0, method = 'midpoint')
+        return {col: iqr_bounds(q1, q3) for col, q1, q3 in zip(columns, Q1, Q3)}
+        
+    @step("features.drop_outliers", rows="df")
+    def drop_outliers_columns(self,columns,bounds=None,sketch=False,relative_accuracy=0.01):
+        """
+        function that drops the rows which are outliers in at least one of the columns.
+        All the bounds are computed on the same data and the rows are dropped 
+        with one combined mask.
+
+        Parameters
+        ----------
+        columns : list
+            Names of the columns studied.
+        bounds : dictionary, optional
+            Bounds column -> (lower, upper), e.g. computed on the whole dataset 
+            with sketch_outlier_bounds while self.df is one chunk. 
+            The default is the exact bounds of self.df.
+        sketch : bool, optional
+            Approximate the quartiles of self.df with QuantileSketch. The default is False.
+        relative_accuracy : float, optional
+            Relative accuracy of the sketches. The default is 0.01.
+
+        Returns
+        -------
+        None.
+
+        """
+        if bounds == None:
+            if sketch:
+                bounds = sketch_outlier_bounds([self.df], columns, relative_accuracy)
+            else:
+                bounds = self.outlier_bounds(columns)
+        
+        # outliers are the values beyond or on the bounds
+        is_outlier = np.zeros(len(self.df), dtype=bool)
+        for col in columns:
+            lower, upper = bounds[col]
+            values = self.df[col].to_numpy(dtype=float)
+            column_outliers = (values >= upper) | (values <= lower)
+            count_rule("{} outside the IQR bounds".format(col), column_outliers.sum())
+            is_outlier |= column_outliers
  
         # removing the Outliers 
-        self.df.drop(upper[0], inplace = True)
-        self.df.drop(lower[0], inplace = True)
+        self.df.drop(self.df.index[is_outlier], inplace = True)
         
+    @step("features.drop_unused_columns", rows="df")
     def drop_unused_columns(self,columns_to_keep):
         """
         function which drops that columns that won't be used for training the ML model
@@ -66,9 +255,11 @@ class BuildFeatures:
             columns.remove(col)
         self.df.drop(columns=columns,inplace = True)
         
+    @step("features.feature_encoding", rows="df")
     def feature_encoding(self,columns):
         """
-        function that encodes the categorical columns given as a parameter
+        function that encodes the categorical columns given as a parameter.
+        The vocabulary of each column is kept in self.encoders.
 
         Parameters
         ----------
@@ -81,13 +272,15 @@ class BuildFeatures:
 
         """
         for col in columns:
-            self.df[col] = self.df[col].astype('category')
-            self.df[col] = self.df[col].cat.codes
+            self.encoders.fit_column(col, self.df[col])
+            self.df[col] = self.encoders.transform_column(col, self.df[col])
             
         
+    @step("features.target_encoding", rows="df")
     def target_encoding(self,target):
         """
-        function that encodes the target variable
+        function that encodes the target variable.
+        The classes of the target are kept in self.encoders.
 
         Parameters
         ----------
@@ -99,16 +292,17 @@ class BuildFeatures:
         None.
 
         """
-        le = preprocessing.LabelEncoder()
-        le.fit(self.df[target])
-        self.df[target] = le.transform(self.df[target])        
-        print("[0,1] represents :",le.inverse_transform([0,1]))
+        self.encoders.fit_target(target, self.df[target])
+        self.df[target] = self.encoders.transform_target(self.df[target])
+        print("[0,1] represents :",self.encoders.inverse_target([0,1]))
         
+    @step("features.save_features", rows="df")
     def save_features(self):
-        # store clean dataframe into a csvFile
-        csvPath = os.path.join(self.project_dir,"data","processed.csv")
-        self.df.to_csv(csvPath,index=False)
-        print("Feature Engineering is Done. You can find the csvFile in data/processed.csv")
+        # store processed dataframe
+        self.storage.write(self.df, "processed", index=False)
+        # store the encoders used to encode new data
+        self.encoders.save(os.path.join(self.project_dir,"models","encoders.json"))
+        print("Feature Engineering is Done. You can find the file in", self.storage.relative_path("processed"))
         
         
         
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Nov  3 16:25:08 2022
+
+@author: fatima-zahrabanani
+"""
+import numpy as np
+
+
+class QuantileSketch:
+    """
+    class approximating the quantiles of a column that doesn't fit in memory.
+    Values are counted in buckets whose bounds grow geometrically, so that
+    every quantile is returned with a relative error below relative_accuracy.
+    Sketches of different chunks or partitions can be merged.
+    """
+    def __init__(self, relative_accuracy = 0.01, min_value = 1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy)/(1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        # values closer to 0 are counted as 0
+        self.min_value = min_value
+        # dictionaries bucket index -> count for the positive and negative values
+        self.positives = dict()
+        self.negatives = dict()
+        self.zeros = 0
+        self.count = 0
+
+    def add_counts(self, store, values):
+        indices, counts = np.unique(np.ceil(np.log(values)/self.log_gamma).astype(np.int64), return_counts=True)
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            store[index] = store.get(index, 0) + count
+
+    def update(self, values):
+        """
+        function which adds values to the sketch, missing values are ignored.
+
+        Parameters
+        ----------
+        values : array-like
+            Numerical values.
+
+        Returns
+        -------
+        None.
+
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.add_counts(self.positives, values[values > self.min_value])
+        self.add_counts(self.negatives, -values[values < -self.min_value])
+        self.zeros += int((np.abs(values) <= self.min_value).sum())
+        self.count += len(values)
+
+    def merge(self, other):
+        """
+        function which adds the counts of another sketch with the same accuracy.
+
+        Returns
+        -------
+        None.
+
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Sketches with different relative accuracies can't be merged")
+        for store, other_store in [(self.positives, other.positives), (self.negatives, other.negatives)]:
+            for index, count in other_store.items():
+                store[index] = store.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def bucket_value(self, index):
+        return 2*self.gamma**index/(self.gamma + 1)
+
+    def quantile(self, q):
+        """
+        function which returns the approximate q-th quantile.
+
+        Parameters
+        ----------
+        q : float
+            Quantile between 0 and 1.
+
+        Returns
+        -------
+        float, nan if the sketch is empty
+
+        """
+        if self.count == 0:
+            return np.nan
+        rank = q*(self.count - 1)
+        # buckets in increasing order of value
+        buckets = [(-self.bucket_value(index), self.negatives[index]) for index in sorted(self.negatives, reverse=True)]
+        buckets.append((0.0, self.zeros))
+        buckets += [(self.bucket_value(index), self.positives[index]) for index in sorted(self.positives)]
+        seen = 0
+        for value, count in buckets:
+            seen += count
+            if count > 0 and seen > rank:
+                return value
+        return value
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Nov 16 09:21:44 2022
+
+@author: fatima-zahrabanani
+"""
+from contextlib import contextmanager
+import threading
+import functools
+import datetime
+import json
+import time
+import uuid
+import os
+
+# recorders switched on in this process (the last one receives the records)
+_recorders = []
+
+# steps being run, the rule counts go to the innermost one
+_open_steps = []
+
+# environment variable switching the instrumentation on for a whole
+# process (e.g. nightly runs), its value is the json lines file
+ENVIRONMENT_VARIABLE = "PIPELINE_INSTRUMENTATION"
+
+
+class PeakRss:
+    """
+    context manager sampling the resident memory of the process in a
+    thread, every interval seconds, to get its peak during a step.
+    Only available on linux (None elsewhere).
+    """
+    def __init__(self, interval = 0.005):
+        self.interval = interval
+        self.peak = None
+        self.stop = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        with open("/proc/self/statm", 'r') as statm:
+            rss = int(statm.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+        self.peak = rss if self.peak == None else max(self.peak, rss)
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        if os.path.exists("/proc/self/statm"):
+            self.sample()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.thread != None:
+            self.stop.set()
+            self.thread.join()
+            self.sample()
+
+    def peak_mb(self):
+        return round(self.peak/2**20, 1) if self.peak != None else None
+
+
+class JsonLinesSink:
+    """
+    sink appending each record as one json line to a file.
+    """
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, record):
+        with open(self.path, 'a') as records_file:
+            records_file.write(json.dumps(record, default=str) + "\n")
+
+
+class ListSink(list):
+    """
+    sink keeping the records in memory.
+    """
+    def __call__(self, record):
+        self.append(record)
+
+
+class Recorder:
+    """
+    class receiving the records of the instrumented steps and passing
+    them to a sink: a JsonLinesSink, a ListSink or any function taking
+    a dictionary.
+    Only the steps run by the process which switched the recorder on are
+    recorded, the worker processes send their records back to it
+    (see emit_records).
+    """
+    def __init__(self, sink = None, run_id = None):
+        if sink == None:
+            sink = ListSink()
+        elif isinstance(sink, str):
+            sink = JsonLinesSink(sink)
+        self.sink = sink
+        self.run_id = run_id if run_id != None else uuid.uuid4().hex[:12]
+        self.pid = os.getpid()
+
+    def emit(self, record):
+        record["run"] = self.run_id
+        # the records of the workers keep their pid (see emit_records)
+        record.setdefault("pid", os.getpid())
+        self.sink(record)
+
+
+def active_recorder():
+    if len(_recorders) == 0 and os.environ.get(ENVIRONMENT_VARIABLE):
+        enable(os.environ[ENVIRONMENT_VARIABLE])
+    if len(_recorders) > 0 and _recorders[-1].pid == os.getpid():
+        return _recorders[-1]
+    return None
+
+
+def enable(sink = None, run_id = None):
+    """
+    function which switches the instrumentation on until disable is called.
+
+    Parameters
+    ----------
+    sink : str or function, optional
+        Path of a json lines file or function receiving each record.
+        The default is None, the records are kept in memory.
+    run_id : str, optional
+        Identifier added to the records. The default is a random one.
+
+    Returns
+    -------
+    Recorder
+
+    """
+    recorder = Recorder(sink, run_id)
+    _recorders.append(recorder)
+    return recorder
+
+
+def disable(recorder = None):
+    if recorder == None and len(_recorders) > 0:
+        _recorders.pop()
+    elif recorder in _recorders:
+        _recorders.remove(recorder)
+
+
+@contextmanager
+def instrument(sink = None, run_id = None):
+    """
+    context manager switching the instrumentation on in its block.
+
+        with instrument("data/instrumentation.jsonl"):
+            makeData.clean_dataset()
+
+    Returns
+    -------
+    Recorder
+
+    """
+    recorder = enable(sink, run_id)
+    try:
+        yield recorder
+    finally:
+        disable(recorder)
+
+
+def count_rule(rule, rows):
+    """
+    function which adds to the current step the number of rows dropped
+    or values replaced by nan by a rule. Does nothing when the
+    instrumentation is off.
+
+    Parameters
+    ----------
+    rule : str
+        Name of the rule.
+    rows : int
+        Number of rows or values.
+
+    Returns
+    -------
+    None.
+
+    """
+    if len(_open_steps) > 0 and active_recorder() != None:
+        rules = _open_steps[-1]["rules"]
+        rules[rule] = rules.get(rule, 0) + int(rows)
+
+
+def emit_records(records):
+    """
+    function which passes the records of the steps run by a worker
+    process (recorded with instrument) to the recorder of this process,
+    the steps without parent become children of the current step.
+    Does nothing when the instrumentation is off.
+
+    Parameters
+    ----------
+    records : list
+        Records of the worker.
+
+    Returns
+    -------
+    None.
+
+    """
+    recorder = active_recorder()
+    if recorder == None:
+        return
+    for record in records:
+        if record["parent"] == None and len(_open_steps) > 0:
+            record["parent"] = _open_steps[-1]["step"]
+        recorder.emit(record)
+
+
+def n_rows(data):
+    try:
+        return len(data) if data is not None else None
+    except TypeError:
+        return None
+
+
+def step(name, rows = None):
+    """
+    decorator recording a method of the pipeline classes when the
+    instrumentation is on: wall time, peak resident memory, rows in and
+    out and the counts of the rules (see count_rule).
+
+    Parameters
+    ----------
+    name : str
+        Name of the step.
+    rows : str, optional
+        Attribute of the object holding the data of the step (e.g. "df").
+        The default is None, the rows in are the ones of the first
+        argument and the rows out the ones of the returned value.
+
+    Returns
+    -------
+    decorator
+
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            recorder = active_recorder()
+            if recorder == None:
+                return method(self, *args, **kwargs)
+
+            if rows != None:
+                rows_in = n_rows(getattr(self, rows, None))
+            else:
+                rows_in = n_rows(args[0]) if len(args) > 0 else None
+            # a forked worker inherits the open steps of its parent, they are not its parents
+            record = {"step": name, "class": type(self).__name__, "rules": dict(), "pid": os.getpid(),
+                      "parent": _open_steps[-1]["step"] if len(_open_steps) > 0 and _open_steps[-1]["pid"] == os.getpid() else None,
+                      "start": datetime.datetime.now().isoformat(timespec="milliseconds")}
+            _open_steps.append(record)
+            try:
+                with PeakRss() as rss:
+                    start = time.perf_counter()
+                    result = method(self, *args, **kwargs)
+                    seconds = time.perf_counter() - start
+            finally:
+                _open_steps.pop()
+
+            rows_out = n_rows(getattr(self, rows, None)) if rows != None else n_rows(result)
+            record.update({"seconds": round(seconds, 6), "peak_rss_mb": rss.peak_mb(),
+                           "rows_in": rows_in, "rows_out": rows_out,
+                           "rows_dropped": rows_in - rows_out if rows_in != None and rows_out != None else None})
+            recorder.emit(record)
+            return result
+        return wrapper
+    return decorator
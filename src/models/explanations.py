@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Nov 10 10:18:43 2022
+
+@author: fatima-zahrabanani
+"""
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import numpy as np
+import hashlib
+import pickle
+import json
+import os
+
+
+def model_hash(model):
+    """
+    function which hashes a fitted model by its pickled bytes.
+
+    Returns
+    -------
+    str
+
+    """
+    return hashlib.sha256(pickle.dumps(model)).hexdigest()
+
+
+def stratified_sample(df, target, n_rows = None, random_state = 1):
+    """
+    function which samples n_rows rows keeping the proportion of each
+    class of the target. The rows keep their order in df.
+
+    Parameters
+    ----------
+    df : Pandas dataFrame
+        Rows to sample.
+    target : str
+        Column of the classes.
+    n_rows : int, optional
+        Size of the sample. The default is None, all the rows.
+    random_state : int, optional
+        Seed of the sample. The default is 1.
+
+    Returns
+    -------
+    Pandas dataFrame
+
+    """
+    if n_rows == None or n_rows >= len(df):
+        return df
+    fraction = n_rows/len(df)
+    sample = df.groupby(target, group_keys=False).sample(frac=fraction, random_state=random_state)
+    return df.loc[df.index.isin(sample.index)]
+
+
+def chunk_shap_values(model, X):
+    """
+    function which computes the SHAP values of a chunk of rows.
+
+    Returns
+    -------
+    numpy array of shape (n_rows, n_features, n_classes)
+
+    """
+    import shap
+    values = shap.TreeExplainer(model).shap_values(X)
+    # older versions of shap return one array per class
+    if isinstance(values, list):
+        values = np.stack(values, axis=-1)
+    return values
+
+
+def compute_shap_values(model, X, chunksize = 10000, workers = 1):
+    """
+    function which computes the SHAP values of X by chunks of rows,
+    in parallel processes if workers > 1.
+
+    Parameters
+    ----------
+    model : fitted tree model
+        Model to explain.
+    X : Pandas dataFrame
+        Rows to explain.
+    chunksize : int, optional
+        Rows per chunk. The default is 10000.
+    workers : int, optional
+        Number of processes. The default is 1.
+
+    Returns
+    -------
+    numpy array of shape (n_rows, n_features, n_classes)
+
+    """
+    chunks = [X.iloc[start:start + chunksize] for start in range(0, len(X), chunksize)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            values = list(executor.map(chunk_shap_values, [model]*len(chunks), chunks))
+    else:
+        values = [chunk_shap_values(model, chunk) for chunk in chunks]
+    return np.concatenate(values, axis=0)
+
+
+class ShapStore:
+    """
+    class persisting the SHAP values next to the model, in
+    models/shap_<model hash>.npz, with the explained rows and the
+    settings of the sample. They are only computed again if the
+    model or the settings change.
+    """
+    def __init__(self, project_dir):
+        self.project_dir = project_dir
+
+    def path(self, model):
+        return os.path.join(self.project_dir,"models","shap_{}.npz".format(model_hash(model)[:16]))
+
+    def load(self, model, settings = None):
+        """
+        function which returns the stored SHAP values of the model.
+
+        Parameters
+        ----------
+        model : fitted tree model
+            Explained model.
+        settings : dictionary, optional
+            Settings of the sample, the stored values are only
+            returned if they were computed with the same settings.
+
+        Returns
+        -------
+        (numpy array of SHAP values, Pandas dataFrame of the explained rows),
+        None if they are not stored
+
+        """
+        path = self.path(model)
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as stored:
+            if settings != None and str(stored["settings"]) != json.dumps(settings, sort_keys=True):
+                return None
+            # one array per column keeps the dtypes of the explained rows
+            features = stored["features"].tolist()
+            X = pd.DataFrame({feature: stored["column_{}".format(i)] for i, feature in enumerate(features)}, index=stored["index"])
+            return stored["values"], X
+
+    def save(self, model, values, X, settings = None):
+        columns = {"column_{}".format(i): X[feature].to_numpy() for i, feature in enumerate(X.columns)}
+        np.savez(self.path(model), values=values, features=np.array(X.columns, dtype=str),
+                 index=X.index.to_numpy(), settings=json.dumps(settings, sort_keys=True), **columns)
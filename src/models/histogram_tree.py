@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Nov 21 10:18:27 2022
+
+@author: fatima-zahrabanani
+
+Out-of-core training of a decision tree on a dataset read by chunks.
+
+The rows are split between train and test by a hash of their ID, so the
+split doesn't depend on the order or the size of the chunks. A first pass
+over the training rows finds the bins of each feature (the distinct values
+of the categorical codes, the quantiles of a QuantileSketch otherwise).
+The tree is then grown one level per pass: each pass counts, for every
+node of the level, the rows of each (feature, bin, class), and every node
+is split at the bin edge that decreases the impurity the most. The counts
+on each side of a split are the class counts of the children, so a tree
+of depth d is built with 1 + d passes and memory bounded by the chunks.
+"""
+from src.models.tree_inference import CompiledTree
+from src.features.quantile_sketch import QuantileSketch
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+
+# modulus of the hashed IDs compared to the test size
+HASH_BUCKETS = 10000
+
+
+def hash_split(ids, test_size, seed = 1):
+    """
+    function which puts each row in the train or in the test data
+    from the hash of its ID.
+
+    Parameters
+    ----------
+    ids : array-like
+        IDs of the rows.
+    test_size : float
+        Expected proportion of test rows.
+    seed : int, optional
+        Seed of the hash, changes the split. The default is 1.
+
+    Returns
+    -------
+    numpy array of booleans, True for the test rows
+
+    """
+    hashed = pd.util.hash_array(np.asarray(ids), hash_key="{:016d}".format(seed))
+    return (hashed % HASH_BUCKETS) < test_size*HASH_BUCKETS
+
+
+def impurity(counts, criterion):
+    """
+    function which returns the impurity of class counts along their last axis.
+    """
+    n = counts.sum(axis=-1, keepdims=True)
+    p = counts/np.maximum(n, 1)
+    if criterion == "gini":
+        return 1 - (p**2).sum(axis=-1)
+    if criterion in ("entropy", "log_loss"):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return -np.where(p > 0, p*np.log2(p), 0).sum(axis=-1)
+    raise ValueError("Unknown criterion {}, expected gini, entropy or log_loss".format(criterion))
+
+
+class BinMapper:
+    """
+    class computing, over chunks of data, the bin edges of each feature.
+    A feature with at most max_bins distinct values gets an edge between
+    each pair of consecutive values (the thresholds of sklearn), the other
+    features get the edges of max_bins quantiles.
+    """
+    def __init__(self, max_bins = 64, relative_accuracy = 0.01):
+        self.max_bins = max_bins
+        self.relative_accuracy = relative_accuracy
+        self.distinct = dict()
+        self.sketches = dict()
+        self.edges = None
+
+    def update(self, X):
+        """
+        function which adds a chunk of features to the statistics of the bins.
+
+        Parameters
+        ----------
+        X : numpy array of shape (n_rows, n_features)
+            Features as float32, the precision of the comparisons with the thresholds.
+
+        Returns
+        -------
+        None.
+
+        """
+        for column in range(X.shape[1]):
+            values = X[:, column].astype(np.float64)
+            values = values[~np.isnan(values)]
+            self.sketches.setdefault(column, QuantileSketch(self.relative_accuracy)).update(values)
+            # the distinct values stop being collected once there are too many
+            if self.distinct.get(column, 0) is not None:
+                distinct = np.union1d(self.distinct.get(column, np.array([])), np.unique(values))
+                self.distinct[column] = distinct if len(distinct) <= self.max_bins else None
+
+    def fit(self):
+        self.edges = []
+        for column in sorted(self.sketches):
+            distinct = self.distinct.get(column)
+            if distinct is not None:
+                edges = (distinct[:-1] + distinct[1:])/2
+            else:
+                quantiles = [self.sketches[column].quantile(q) for q in np.arange(1, self.max_bins)/self.max_bins]
+                edges = np.unique(quantiles)
+            # an edge rounded like the float32 features keeps the binning and the predictions consistent
+            self.edges.append(np.unique(edges.astype(np.float32)).astype(np.float64))
+        return self
+
+    def transform(self, X):
+        """
+        function which returns the bin of each value: the first edge it is
+        lower or equal to, the number of edges beyond the last one and for
+        missing values (like a threshold comparison, which is False for NaN).
+
+        Returns
+        -------
+        numpy array of shape (n_rows, n_features)
+
+        """
+        bins = np.empty(X.shape, dtype=np.int32)
+        for column, edges in enumerate(self.edges):
+            bins[:, column] = np.searchsorted(edges, X[:, column].astype(np.float64), side="left")
+        return bins
+
+
+class HistogramTree:
+    """
+    class training a decision tree from histograms computed chunk by chunk,
+    it gives a CompiledTree evaluated like the exported sklearn trees.
+    """
+    def __init__(self, max_depth = 3, min_samples_leaf = 1, criterion = "gini", max_bins = 64, test_size = 0.25, seed = 1):
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.criterion = criterion
+        self.max_bins = max_bins
+        self.test_size = test_size
+        self.seed = seed
+        self.bins = None
+        self.classes = None
+        self.tree = None
+        self.n_train = 0
+        self.n_passes = 0
+        self.fingerprint = None
+
+    def train_rows(self, chunk, features, target, id_column):
+        # features as float32 and target of the training rows of a chunk
+        is_test = hash_split(chunk[id_column], self.test_size, self.seed)
+        train = chunk[~is_test]
+        return train[features].to_numpy(dtype=np.float32), train[target].to_numpy()
+
+    def fit(self, read_chunks, features, target, id_column = "ID"):
+        """
+        function which trains the tree on the training rows of a dataset.
+
+        Parameters
+        ----------
+        read_chunks : callable
+            Returns a new iterator of Pandas dataFrames (the chunks of the
+            dataset), called once per pass.
+        features : list
+            Names of the features.
+        target : str
+            Name of the (encoded) target column.
+        id_column : str, optional
+            Column hashed to split the rows. The default is "ID".
+
+        Returns
+        -------
+        CompiledTree
+
+        """
+        # first pass: bins, classes, size and fingerprint of the training data
+        mapper = BinMapper(self.max_bins)
+        classes = np.array([])
+        sha256 = hashlib.sha256(json.dumps(features + [target]).encode())
+        self.n_train = 0
+        self.n_passes = 1
+        for chunk in read_chunks():
+            X, y = self.train_rows(chunk, features, target, id_column)
+            mapper.update(X)
+            classes = np.union1d(classes, np.unique(y))
+            sha256.update(pd.util.hash_array(X.ravel()).tobytes())
+            sha256.update(pd.util.hash_array(y).tobytes())
+            self.n_train += len(y)
+        self.bins = mapper.fit()
+        self.classes = classes.astype(np.int64)
+        self.fingerprint = sha256.hexdigest()
+        n_bins = max(len(edges) for edges in self.bins.edges) + 1
+        n_classes = len(self.classes)
+
+        # the tree grows level by level, its nodes are appended so children come after their parent
+        feature, split_bin, threshold, left, right, value = [-2], [-1], [-2.0], [-1], [-1], [None]
+        level = [0]
+        for depth in range(self.max_depth):
+            if len(level) == 0:
+                break
+            # histograms of the nodes of the level: (node, feature, bin, class)
+            position = np.full(len(feature), -1, dtype=np.int64)
+            position[level] = np.arange(len(level))
+            histograms = np.zeros((len(level), len(features), n_bins, n_classes), dtype=np.int64)
+            self.n_passes += 1
+            for chunk in read_chunks():
+                X, y = self.train_rows(chunk, features, target, id_column)
+                bins = self.bins.transform(X)
+                node = self.route(bins, feature, split_bin, left, right, depth)
+                rows = position[node] != -1
+                node_position, bins, codes = position[node[rows]], bins[rows], np.searchsorted(self.classes, y[rows])
+                for column in range(len(features)):
+                    index = (node_position*n_bins + bins[:, column])*n_classes + codes
+                    histograms[:, column] += np.bincount(index, minlength=len(level)*n_bins*n_classes).reshape(len(level), n_bins, n_classes)
+            if depth == 0:
+                value[0] = histograms[0, 0].sum(axis=0)
+
+            next_level = []
+            for p, node in enumerate(level):
+                split = self.best_split(histograms[p])
+                if split == None:
+                    continue
+                column, b, left_counts, right_counts = split
+                feature[node], split_bin[node], threshold[node] = column, b, self.bins.edges[column][b]
+                for counts, children in [(left_counts, left), (right_counts, right)]:
+                    children[node] = len(feature)
+                    next_level.append(len(feature))
+                    feature.append(-2), split_bin.append(-1), threshold.append(-2.0)
+                    left.append(-1), right.append(-1), value.append(counts)
+            # the children of the last level are leaves, their counts are known from their parent
+            level = next_level
+
+        self.tree = CompiledTree(np.array(feature, dtype=np.int32), np.array(threshold, dtype=np.float64),
+                                 np.array(left, dtype=np.int32), np.array(right, dtype=np.int32),
+                                 np.array(value, dtype=np.float64), self.classes, features)
+        return self.tree
+
+    def route(self, bins, feature, split_bin, left, right, depth):
+        # node of each row in the tree grown so far
+        node = np.zeros(len(bins), dtype=np.int64)
+        feature, split_bin, left, right = np.array(feature), np.array(split_bin), np.array(left), np.array(right)
+        rows = np.arange(len(bins))
+        for _ in range(depth):
+            go_left = bins[rows, np.maximum(feature[node], 0)] <= split_bin[node]
+            node = np.where(left[node] != -1, np.where(go_left, left[node], right[node]), node)
+        return node
+
+    def best_split(self, histogram):
+        """
+        function which returns the split of a node with the lowest
+        weighted impurity of its children.
+
+        Parameters
+        ----------
+        histogram : numpy array of shape (n_features, n_bins, n_classes)
+            Counts of the rows of the node.
+
+        Returns
+        -------
+        (feature, bin, class counts on the left, class counts on the right),
+        None if the node is pure or can't be split with min_samples_leaf rows on each side
+
+        """
+        total = histogram[0].sum(axis=0)
+        n = total.sum()
+        if n < 2*self.min_samples_leaf or (total > 0).sum() <= 1:
+            return None
+        left_counts = np.cumsum(histogram, axis=1)[:, :-1]
+        right_counts = total - left_counts
+        n_left, n_right = left_counts.sum(axis=2), right_counts.sum(axis=2)
+        children = (n_left*impurity(left_counts, self.criterion) + n_right*impurity(right_counts, self.criterion))/n
+        children[(n_left < self.min_samples_leaf) | (n_right < self.min_samples_leaf)] = np.inf
+        column, b = np.unravel_index(np.argmin(children), children.shape)
+        if not np.isfinite(children[column, b]):
+            return None
+        return int(column), int(b), left_counts[column, b], right_counts[column, b]
+
+    def score(self, read_chunks, features, target, id_column = "ID", model = None):
+        """
+        function which returns the accuracy of the tree (or of another
+        model with a predict method) on the test rows, read by chunks.
+
+        Returns
+        -------
+        (accuracy, number of test rows)
+
+        """
+        model = model if model != None else self.tree
+        correct, n_test = 0, 0
+        for chunk in read_chunks():
+            test = chunk[hash_split(chunk[id_column], self.test_size, self.seed)]
+            if len(test) == 0:
+                continue
+            X = test[features].to_numpy(dtype=np.float32) if model is self.tree else test[features]
+            correct += int((model.predict(X) == test[target].to_numpy()).sum())
+            n_test += len(test)
+        return correct/max(n_test, 1), n_test
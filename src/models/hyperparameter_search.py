@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Nov  9 14:02:51 2022
+
+@author: fatima-zahrabanani
+"""
+from sklearn.base import clone
+from sklearn.model_selection import ParameterGrid, cross_val_score
+from joblib import Parallel, delayed
+from src.models.shared_dataset import SharedDataset, fold_score
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+
+# name of the file, inside the models folder, storing the cross-validation scores
+SCORES_FILE = "cv_scores.json"
+
+
+def data_fingerprint(X, y):
+    """
+    function which hashes the rows used for a cross-validation,
+    in their order since the folds depend on it.
+
+    Returns
+    -------
+    str
+
+    """
+    sha256 = hashlib.sha256()
+    sha256.update(json.dumps([str(column) for column in X.columns]).encode())
+    sha256.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    sha256.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+    return sha256.hexdigest()
+
+
+class ScoreCache:
+    """
+    class storing on disk the cross-validation score of each
+    (estimator, parameters, data fingerprint, cv, scoring), so that a
+    candidate already evaluated on the same data is never fitted again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.scores = self.read()
+
+    def read(self):
+        try:
+            with open(self.path, 'r') as scores_file:
+                return json.load(scores_file)
+        except (OSError, ValueError):
+            return dict()
+
+    def write(self):
+        # atomic replacement, concurrent trainings never read a partial file
+        tmpPath = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            with open(tmpPath, 'w') as scores_file:
+                json.dump(self.scores, scores_file)
+            os.replace(tmpPath, self.path)
+        except OSError:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+
+    @staticmethod
+    def key(estimator, params, fingerprint, cv, scoring):
+        content = {"estimator": type(estimator).__name__,
+                   "base_params": estimator.get_params(),
+                   "params": params,
+                   "data": fingerprint,
+                   "cv": cv,
+                   "scoring": scoring}
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key):
+        return self.scores.get(key)
+
+    def set(self, key, score):
+        self.scores[key] = score
+
+
+def candidate_score(estimator, params, X, y, cv, scoring):
+    return float(np.mean(cross_val_score(clone(estimator).set_params(**params), X, y, cv=cv, scoring=scoring)))
+
+
+def shared_candidate_scores(estimator, candidates, X, y, cv, scoring, n_jobs):
+    """
+    function which cross-validates candidates on a SharedDataset: every
+    (candidate, fold) fit is a task of the workers, which memory-map the
+    features instead of receiving a copy of them.
+
+    Returns
+    -------
+    list of float, the mean score of each candidate
+
+    """
+    with SharedDataset(X, y, cv, estimator) as dataset:
+        n_splits = dataset.n_splits
+        scores = Parallel(n_jobs=n_jobs)(delayed(fold_score)(dataset.path, estimator, params, k, scoring)
+                                         for params in candidates for k in range(n_splits))
+    return [float(np.mean(scores[i*n_splits:(i+1)*n_splits])) for i in range(len(candidates))]
+
+
+class GridSearch:
+    """
+    exhaustive search: every candidate is cross-validated on all the rows.
+    Gives the same best parameters as GridSearchCV.
+    """
+    def __init__(self, cv = 4, scoring = "accuracy", cache = None, n_jobs = -1, shared = True):
+        self.cv = cv
+        self.scoring = scoring
+        self.cache = cache
+        self.n_jobs = n_jobs
+        # the workers share one memory-mapped copy of the data (SharedDataset)
+        # instead of receiving each their own copy of X
+        self.shared = shared
+        self.results = []
+
+    def scores(self, estimator, candidates, X, y):
+        """
+        function which returns the mean cross-validation score of each
+        candidate on X, y. Only the candidates missing from the cache
+        are fitted, in parallel.
+
+        Parameters
+        ----------
+        estimator : sklearn estimator
+            Estimator whose parameters are searched.
+        candidates : list
+            Dictionaries of parameters.
+        X : Pandas dataFrame
+            Features.
+        y : Pandas Series
+            Target.
+
+        Returns
+        -------
+        list of float
+
+        """
+        fingerprint = data_fingerprint(X, y)
+        keys = [ScoreCache.key(estimator, params, fingerprint, self.cv, self.scoring) for params in candidates]
+        scores = [self.cache.get(key) if self.cache != None else None for key in keys]
+        missing = [i for i, score in enumerate(scores) if score == None]
+        print("{} candidates on {} rows: {} fitted, {} cached".format(len(candidates), len(X), len(missing), len(candidates) - len(missing)))
+
+        if self.shared and len(missing) > 0:
+            fitted = shared_candidate_scores(estimator, [candidates[i] for i in missing], X, y, self.cv, self.scoring, self.n_jobs)
+        else:
+            fitted = Parallel(n_jobs=self.n_jobs)(delayed(candidate_score)(estimator, candidates[i], X, y, self.cv, self.scoring) for i in missing)
+        for i, score in zip(missing, fitted):
+            scores[i] = score
+            if self.cache != None:
+                self.cache.set(keys[i], score)
+        if self.cache != None and len(missing) > 0:
+            self.cache.write()
+        self.results += [{"params": params, "n_rows": len(X), "score": score} for params, score in zip(candidates, scores)]
+        return scores
+
+    def search(self, estimator, param_grid, X, y):
+        """
+        function which returns the best parameters of param_grid, the
+        first candidate of the grid wins ties like in GridSearchCV.
+
+        Returns
+        -------
+        dictionary of parameters, best score
+
+        """
+        candidates = list(ParameterGrid(param_grid))
+        scores = self.scores(estimator, candidates, X, y)
+        best = int(np.argmax(scores))
+        return candidates[best], scores[best]
+
+
+class SuccessiveHalving(GridSearch):
+    """
+    successive halving search: all the candidates are cross-validated on a
+    small subsample, only the best 1/factor of them are kept and evaluated
+    on factor times more rows, until the last round uses all the rows.
+    The subsamples are nested and drawn with a fixed seed, so the scores of
+    the rounds are cached like the ones of the exhaustive search.
+    """
+    def __init__(self, cv = 4, scoring = "accuracy", cache = None, n_jobs = -1, factor = 3, min_rows = None, random_state = 1, shared = True):
+        super().__init__(cv, scoring, cache, n_jobs, shared)
+        self.factor = factor
+        # rows of the first round, by default the rounds end with all the rows
+        self.min_rows = min_rows
+        self.random_state = random_state
+
+    def search(self, estimator, param_grid, X, y):
+        candidates = list(ParameterGrid(param_grid))
+        n_rounds = int(np.ceil(np.log(len(candidates))/np.log(self.factor))) + 1 if len(candidates) > 1 else 1
+        min_rows = self.min_rows if self.min_rows != None else len(X)//self.factor**(n_rounds - 1)
+        # every fold needs rows of each class
+        min_rows = max(min_rows, 2*self.cv*y.nunique())
+
+        order = np.random.RandomState(self.random_state).permutation(len(X))
+        for round in range(n_rounds):
+            n_rows = min(len(X), min_rows*self.factor**round)
+            if round == n_rounds - 1 or len(candidates) == 1:
+                n_rows = len(X)
+            rows = np.sort(order[:n_rows]) if n_rows < len(X) else np.arange(len(X))
+            scores = self.scores(estimator, candidates, X.iloc[rows], y.iloc[rows])
+            if n_rows == len(X):
+                break
+            # best candidates first, the grid order breaks ties
+            kept = int(np.ceil(len(candidates)/self.factor))
+            ranking = sorted(range(len(candidates)), key=lambda i: -scores[i])[:kept]
+            candidates = [candidates[i] for i in sorted(ranking)]
+
+        best = int(np.argmax(scores))
+        return candidates[best], scores[best]
+
+
+def make_search(search, cv = 4, scoring = "accuracy", cache = None):
+    """
+    function which returns the search strategy.
+
+    Parameters
+    ----------
+    search : str or object
+        "grid", "halving" or an object with a search(estimator, param_grid, X, y) method.
+
+    Returns
+    -------
+    search strategy
+
+    """
+    if search == "grid":
+        return GridSearch(cv = cv, scoring = scoring, cache = cache)
+    if search == "halving":
+        return SuccessiveHalving(cv = cv, scoring = scoring, cache = cache)
+    if hasattr(search, "search"):
+        return search
+    raise ValueError("Unknown search strategy {}, expected 'grid', 'halving' or an object with a search method".format(search))
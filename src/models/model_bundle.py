@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Nov 18 11:05:42 2022
+
+@author: fatima-zahrabanani
+
+Versioned binary file of the trained model, replacing the pickled estimator.
+
+    8 bytes     magic b"KSMODEL\\0"
+    4 bytes     format version (little-endian uint32)
+    4 bytes     length of the header (little-endian uint32)
+    header      json: features, target, names of the target classes, encoders,
+                training data fingerprint, metrics, parameters and
+                offset/dtype/shape of each array
+    padding     up to a multiple of ALIGNMENT bytes
+    arrays      the arrays of the tree, each one starting on a multiple of
+                ALIGNMENT bytes, in little-endian order
+
+The arrays are mapped read-only from the file (numpy.memmap): loading only
+reads the header, and the scoring processes mapping the same file share its
+pages instead of each holding a copy of the model.
+"""
+from src.models.tree_inference import CompiledTree
+from src.features.build_features import Encoders
+import numpy as np
+import datetime
+import hashlib
+import struct
+import json
+import os
+
+MAGIC = b"KSMODEL\0"
+
+# version of the layout, the version 2 adds the side of the missing values of each split
+FORMAT_VERSION = 2
+
+# alignment of the header end and of each array, in bytes
+ALIGNMENT = 64
+
+# name of the bundle in the models folder
+BUNDLE_FILE = "model.bundle"
+
+# arrays of the tree and their stored dtype
+TREE_ARRAYS = {"feature": "<i4", "threshold": "<f8", "left": "<i4", "right": "<i4", "value": "<f8", "classes": "<i8", "missing_left": "|u1"}
+
+
+def padding(offset):
+    return (-offset) % ALIGNMENT
+
+
+def write_bundle(path, tree, encoders = None, metrics = None, data_fingerprint = None, params = None, target = None, target_classes = None):
+    """
+    function which writes the bundle of a trained tree. The file is
+    written next to its destination and renamed, so a scoring process
+    never maps a partial bundle.
+
+    Parameters
+    ----------
+    path : str
+        Path of the bundle.
+    tree : CompiledTree
+        Trained tree, with the names of its features.
+    encoders : Encoders, optional
+        Encoders of the categorical columns and of the target.
+    metrics : dictionary, optional
+        Metrics of the model (e.g. accuracy).
+    data_fingerprint : str, optional
+        Hash of the training data.
+    params : dictionary, optional
+        Hyperparameters of the model.
+    target : str, optional
+        Name of the target column.
+    target_classes : list, optional
+        Names of the classes of the tree, in the order of tree.classes,
+        used without encoders. The default is the classes of the tree.
+
+    Returns
+    -------
+    None.
+
+    """
+    arrays = {name: np.ascontiguousarray(getattr(tree, name), dtype=dtype) for name, dtype in TREE_ARRAYS.items()}
+    # name of each class of the tree, so the predictions can be decoded without the encoders
+    if encoders != None and encoders.target_classes != None:
+        target_classes = [encoders.target_classes[code] for code in tree.classes]
+    elif target_classes == None:
+        target_classes = tree.classes.tolist()
+    if len(target_classes) != len(tree.classes):
+        raise ValueError("The tree has {} classes, {} names were given".format(len(tree.classes), len(target_classes)))
+    header = {"features": tree.features,
+              "target": target if target != None else (encoders.target if encoders != None else None),
+              "target_classes": list(target_classes),
+              "encoders": {"vocabularies": encoders.vocabularies, "target": encoders.target,
+                           "target_classes": encoders.target_classes} if encoders != None else None,
+              "data_fingerprint": data_fingerprint,
+              "metrics": metrics or dict(),
+              "params": params or dict(),
+              "max_depth": tree.max_depth,
+              "created": datetime.datetime.now().isoformat(timespec="seconds"),
+              "arrays": dict()}
+
+    # offsets of the arrays, relative to the start of the data section
+    offset = 0
+    sha256 = hashlib.sha256()
+    for name, array in arrays.items():
+        offset += padding(offset)
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+        sha256.update(array.tobytes())
+    header["sha256"] = sha256.hexdigest()
+
+    header_bytes = json.dumps(header, default=str).encode()
+    start = len(MAGIC) + 8 + len(header_bytes)
+    tmpPath = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmpPath, 'wb') as bundle_file:
+        bundle_file.write(MAGIC + struct.pack("<II", FORMAT_VERSION, len(header_bytes)) + header_bytes)
+        bundle_file.write(b"\0"*padding(start))
+        written = 0
+        for name, array in arrays.items():
+            bundle_file.write(b"\0"*(header["arrays"][name]["offset"] - written))
+            bundle_file.write(array.tobytes())
+            written = header["arrays"][name]["offset"] + array.nbytes
+    os.replace(tmpPath, path)
+
+
+class ModelBundle:
+    """
+    class of a trained model loaded from its bundle: the tree (arrays
+    mapped from the file), the encoders and the metadata of the training.
+    """
+    def __init__(self, path, header, tree):
+        self.path = path
+        self.header = header
+        self.tree = tree
+        self.features = header["features"]
+        self.target = header["target"]
+        self.encoders = Encoders(**header["encoders"]) if header["encoders"] != None else None
+        # names of the classes of the tree (taken from the encoders in the version 1)
+        self.target_classes = header.get("target_classes")
+        if self.target_classes == None and self.encoders != None:
+            self.target_classes = [self.encoders.target_classes[code] for code in tree.classes]
+        self.data_fingerprint = header["data_fingerprint"]
+        self.metrics = header["metrics"]
+        self.params = header["params"]
+
+    @classmethod
+    def load(cls, path, verify = False):
+        """
+        function which loads a bundle, its arrays are mapped read-only.
+        Only the header is read, unless verify is True.
+
+        Parameters
+        ----------
+        path : str
+            Path of the bundle.
+        verify : bool, optional
+            Check the sha256 of the arrays, which reads all of them. 
+            The default is False.
+
+        Raises
+        ------
+        ValueError if the file is not a bundle, has an unknown version or is corrupted.
+
+        Returns
+        -------
+        ModelBundle
+
+        """
+        with open(path, 'rb') as bundle_file:
+            prefix = bundle_file.read(len(MAGIC) + 8)
+            if prefix[:len(MAGIC)] != MAGIC:
+                raise ValueError("{} is not a model bundle".format(path))
+            version, header_length = struct.unpack("<II", prefix[len(MAGIC):])
+            if version > FORMAT_VERSION:
+                raise ValueError("{} has the format version {}, this code reads up to {}".format(path, version, FORMAT_VERSION))
+            header = json.loads(bundle_file.read(header_length))
+
+        start = len(MAGIC) + 8 + header_length
+        start += padding(start)
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        arrays = dict()
+        sha256 = hashlib.sha256()
+        for name, description in header["arrays"].items():
+            dtype = np.dtype(description["dtype"])
+            count = int(np.prod(description["shape"]))
+            offset = start + description["offset"]
+            if offset + count*dtype.itemsize > len(data):
+                raise ValueError("{} is truncated".format(path))
+            arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(description["shape"])
+            if verify:
+                sha256.update(arrays[name].tobytes())
+        if verify and sha256.hexdigest() != header["sha256"]:
+            raise ValueError("{} is corrupted, the hash of its arrays doesn't match".format(path))
+
+        tree = CompiledTree(arrays["feature"], arrays["threshold"], arrays["left"], arrays["right"],
+                            arrays["value"], arrays["classes"], header["features"], max_depth = header["max_depth"],
+                            missing_left = arrays.get("missing_left"))
+        return cls(path, header, tree)
+
+    def inverse_target(self, codes):
+        """
+        function which returns the names of the classes predicted by the tree.
+
+        Returns
+        -------
+        numpy array of target names
+
+        """
+        return np.array(self.target_classes)[np.searchsorted(self.tree.classes, codes)]
+
+    def predict(self, projects):
+        """
+        function which predicts the target names of new projects
+        given with their raw values.
+
+        Returns
+        -------
+        numpy array of predicted target names
+
+        """
+        X = self.encoders.transform(projects[self.features])
+        return self.inverse_target(self.tree.predict(X.to_numpy()))
@@ -5,7 +5,9 @@ Created on Mon Oct 17 16:11:34 2022
 
 @author: fatima-zahrabanani
 """
-from sklearn.metrics import accuracy_score
+from src.features.build_features import Encoders
+from src.models.model_bundle import ModelBundle, BUNDLE_FILE
+from src.instrumentation import step
 import pickle
 import os
 
@@ -14,22 +16,74 @@ class Predict:
     """
     class containing methods to predict data based on trained_model
     """
-    def __init__(self,project_dir,test,features,target):
+    def __init__(self,project_dir,test,features,target,verify= False):
         self.project_dir = project_dir 
         self.test = test
         self.features = features
         self.target = target
+        # check the hash of the arrays of the bundle when loading it
+        self.verify = verify
+        self.bundle = None
+        self.model = None
+        self.encoders = None
     
     def load_model(self):
-        filename = os.path.join(self.project_dir,"models",'trained_model.sav')
-        self.model = pickle.load(open(filename, 'rb'))
+        # the model is only loaded once
+        # from models/model.bundle, whose tree is evaluated with numpy and mapped from the file,
+        # or from the pickled sklearn model of a training older than the bundles
+        if self.model is None:
+            bundlePath = os.path.join(self.project_dir,"models",BUNDLE_FILE)
+            if os.path.exists(bundlePath):
+                self.bundle = ModelBundle.load(bundlePath, verify = self.verify)
+                self.model = self.bundle.tree
+                if self.bundle.features != list(self.features):
+                    raise ValueError("The model was trained on the features {}, not {}".format(self.bundle.features, list(self.features)))
+            else:
+                filename = os.path.join(self.project_dir,"models",'trained_model.sav')
+                with open(filename, 'rb') as model_file:
+                    self.model = pickle.load(model_file)
         return self.model
         
+    def load_encoders(self):
+        # the encoders of the bundle are the ones of its training
+        self.load_model()
+        if self.encoders == None and self.bundle != None and self.bundle.encoders != None:
+            self.encoders = self.bundle.encoders
+        elif self.encoders == None:
+            filename = os.path.join(self.project_dir,"models",'encoders.json')
+            self.encoders = Encoders.load(filename)
+        return self.encoders
+    
+    @step("predict.predict")
+    def predict(self, projects):
+        """
+        function which predicts the state of new projects given with
+        their raw values, encoded the same way as the training data.
+
+        Parameters
+        ----------
+        projects : Pandas dataFrame
+            New projects with the features columns.
+
+        Returns
+        -------
+        numpy array of predicted target names
+
+        """
+        encoders = self.load_encoders()
+        X = encoders.transform(projects[self.features])
+        model = self.load_model()
+        if self.bundle != None:
+            return self.bundle.inverse_target(model.predict(X.to_numpy()))
+        return encoders.inverse_target(model.predict(X))
+        
+    @step("predict.accuracy", rows="test")
     def accuracy(self):
         # To Do: fix bug
+        from sklearn.metrics import accuracy_score
         model = self.load_model()
         print(model)
-        y_pred = model.predict(self.test[self.features])
+        y_pred = model.predict(self.test[self.features].to_numpy() if self.bundle != None else self.test[self.features])
         accuracy = accuracy_score(self.test[self.target],y_pred)
         return accuracy
 
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Nov  7 09:58:41 2022
+
+@author: fatima-zahrabanani
+
+Long-lived prediction server: the model and the encoders are loaded once,
+concurrent requests are grouped into one predict call.
+
+    python -m src.models.predict_server --port 8000
+    curl -d '{"main_category": "Art", "currency": "USD", "goal": 1000, "campaign_period": 30}' localhost:8000/predict
+    curl localhost:8000/stats
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from concurrent.futures import Future
+from src.models.predict_model import Predict
+import pandas as pd
+import numpy as np
+import collections
+import threading
+import argparse
+import queue
+import json
+import time
+import os
+
+
+class MicroBatcher:
+    """
+    class grouping the rows of concurrent requests into one predict call.
+    A batch is closed when it has max_batch rows or when its first 
+    request has waited max_wait seconds.
+    """
+    def __init__(self, predict, max_batch = 256, max_wait = 0.002, latency_window = 10000):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        
+        # counters exposed by stats
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.n_requests = 0
+        self.n_rows = 0
+        self.n_batches = 0
+        self.n_failed = 0
+        self.latencies = collections.deque(maxlen=latency_window)
+        
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        
+    def submit(self, rows):
+        """
+        function which queues rows and waits for their predictions.
+
+        Parameters
+        ----------
+        rows : list
+            Rows as dictionaries column -> raw value.
+
+        Returns
+        -------
+        list of predicted target names
+
+        """
+        start = time.perf_counter()
+        future = Future()
+        self.requests.put((rows, future))
+        predictions = future.result()
+        with self.lock:
+            self.n_requests += 1
+            self.latencies.append(time.perf_counter() - start)
+        return predictions
+    
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            n_rows = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while n_rows < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                n_rows += len(batch[-1][0])
+            self.predict_batch(batch)
+            
+    def check_rows(self, rows):
+        """
+        function which checks that the rows of a request can be predicted:
+        a list of json objects with every feature.
+
+        Raises
+        ------
+        ValueError if the rows are not valid.
+
+        Returns
+        -------
+        Pandas dataFrame of the rows
+
+        """
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("The rows must be a list of json objects")
+        missing = sorted({feature for row in rows for feature in self.predict.features if feature not in row})
+        if len(missing) > 0:
+            raise ValueError("Missing features: {}".format(missing))
+        return pd.DataFrame(rows, columns=self.predict.features)
+    
+    def fail(self, future, error):
+        future.set_exception(error)
+        with self.lock:
+            self.n_failed += 1
+            
+    def predict_batch(self, batch):
+        # the requests that can't be predicted fail alone
+        valid = []
+        for request_rows, future in batch:
+            try:
+                valid.append((self.check_rows(request_rows), future))
+            except Exception as error:
+                self.fail(future, error)
+        if len(valid) == 0:
+            return
+        try:
+            frames = [frame for frame, _ in valid]
+            predictions = self.predict.predict(pd.concat(frames, ignore_index=True)).tolist()
+        except Exception:
+            # the failing request is found by predicting each request alone
+            for frame, future in valid:
+                try:
+                    future.set_result(self.predict.predict(frame).tolist())
+                except Exception as error:
+                    self.fail(future, error)
+                    continue
+                with self.lock:
+                    self.n_batches += 1
+                    self.n_rows += len(frame)
+            return
+        with self.lock:
+            self.n_batches += 1
+            self.n_rows += len(predictions)
+        start = 0
+        for frame, future in valid:
+            future.set_result(predictions[start:start+len(frame)])
+            start += len(frame)
+            
+    def stats(self):
+        with self.lock:
+            latencies = np.array(self.latencies)*1000
+            elapsed = time.time() - self.started
+            return {"requests": self.n_requests,
+                    "failed_requests": self.n_failed,
+                    "rows": self.n_rows,
+                    "batches": self.n_batches,
+                    "mean_batch_rows": self.n_rows/self.n_batches if self.n_batches else 0,
+                    "rows_per_second": self.n_rows/elapsed,
+                    "latency_ms": {"p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                                   "p99": float(np.percentile(latencies, 99)) if len(latencies) else None,
+                                   "max": float(latencies.max()) if len(latencies) else None}}
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    POST /predict with one row (json object), a list of rows or {"rows": [...]}
+    GET /stats
+    """
+    def send_json(self, code, content):
+        body = json.dumps(content).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, self.server.batcher.stats())
+        else:
+            self.send_json(404, {"error": "unknown path"})
+            
+    def do_POST(self):
+        if self.path != "/predict":
+            self.send_json(404, {"error": "unknown path"})
+            return
+        try:
+            content = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            single = isinstance(content, dict) and "rows" not in content
+            rows = [content] if single else content["rows"] if isinstance(content, dict) else content
+            predictions = self.server.batcher.submit(rows)
+        except Exception as error:
+            self.send_json(400, {"error": str(error)})
+            return
+        self.send_json(200, {"prediction": predictions[0]} if single else {"predictions": predictions})
+        
+    def log_message(self, format, *args):
+        # no log line per request
+        pass
+
+
+class ThreadingTCPHTTPServer(ThreadingHTTPServer):
+    # concurrent clients are queued instead of refused
+    request_queue_size = 128
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+    
+
+def make_server(project_dir, features, target, host = "127.0.0.1", port = 8000, unix_socket = None, max_batch = 256, max_wait = 0.002):
+    """
+    function which creates the prediction server, listening on a
+    local port or on a Unix socket.
+
+    Returns
+    -------
+    server with a serve_forever method
+
+    """
+    predict = Predict(project_dir, None, features, target, verify = True)
+    # the model (its hash checked) and the encoders are loaded once before serving
+    predict.load_model()
+    predict.load_encoders()
+    
+    if unix_socket != None:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = ThreadingUnixHTTPServer(unix_socket, PredictionHandler)
+    else:
+        server = ThreadingTCPHTTPServer((host, port), PredictionHandler)
+    server.batcher = MicroBatcher(predict, max_batch, max_wait)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-lived prediction server")
+    parser.add_argument("--project-dir", default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    parser.add_argument("--features", nargs="+", default=["main_category","goal","currency","campaign_period"])
+    parser.add_argument("--target", default="state")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket")
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=2)
+    args = parser.parse_args()
+    
+    server = make_server(args.project_dir, args.features, args.target, args.host, args.port, 
+                         args.unix_socket, args.max_batch, args.max_wait_ms/1000)
+    print("Prediction server listening on", args.unix_socket or "{}:{}".format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Nov 22 09:41:13 2022
+
+@author: fatima-zahrabanani
+
+Training data shared by the cross-validation workers without copies.
+
+The features are converted once to a contiguous float32 matrix (the dtype
+the sklearn trees work on) and saved with the target and the fold of each
+row in a temporary folder, in shared memory (/dev/shm) when it has the space.
+The workers receive the folder name only and memory-map the arrays
+copy-on-write (sklearn needs writable buffers but never writes them), so
+the pages of the matrix are shared by all the processes instead of each
+worker unpickling its own copy of the dataFrame. The candidates are fitted
+on the whole matrix with a weight of 0 for the rows of the test fold, the
+training rows are not copied either.
+"""
+from sklearn.base import clone, is_classifier
+from sklearn.model_selection import check_cv
+from sklearn.utils.validation import has_fit_parameter
+from sklearn.metrics import get_scorer
+import numpy as np
+import tempfile
+import shutil
+import os
+
+# shared memory filesystem, used when the dataset fits in it
+SHARED_MEMORY = "/dev/shm"
+
+# arrays attached by the current process, by folder
+_attached = dict()
+
+
+def shared_dir(nbytes):
+    """
+    function which returns the folder of a shared dataset of nbytes bytes:
+    the shared memory filesystem if it is writable and has the space for
+    it, None otherwise (the default temporary folder, the pages of the
+    memory-mapped files are still shared through the page cache).
+
+    Returns
+    -------
+    str or None
+
+    """
+    if not os.path.isdir(SHARED_MEMORY) or not os.access(SHARED_MEMORY, os.W_OK):
+        return None
+    stat = os.statvfs(SHARED_MEMORY)
+    # /dev/shm is backed by the memory, a full one fails the writes (or the workers)
+    if stat.f_bavail*stat.f_frsize < nbytes:
+        print("Not enough space in {} for the shared dataset ({:.1f} MB), the temporary folder is used".format(SHARED_MEMORY, nbytes/2**20))
+        return None
+    return SHARED_MEMORY
+
+
+class SharedDataset:
+    """
+    class materializing the features, the target and the cross-validation
+    folds of a training dataset as memory-mapped arrays.
+    Usable as a context manager, the files are removed when it exits.
+    """
+    def __init__(self, X, y, cv = 4, estimator = None):
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y)
+        self.path = tempfile.mkdtemp(prefix="shared_dataset_", dir=shared_dir(X.nbytes + y.nbytes + 2*len(y)))
+        self.n_rows = len(X)
+        self.n_splits = None
+        try:
+            np.save(os.path.join(self.path, "X.npy"), np.ascontiguousarray(X))
+            np.save(os.path.join(self.path, "y.npy"), y)
+            # same folds as cross_val_score: stratified for a classifier
+            splitter = check_cv(cv, y, classifier = is_classifier(estimator) if estimator != None else True)
+            self.n_splits = splitter.get_n_splits()
+            fold = np.empty(len(X), dtype=np.int16)
+            for k, (_, test) in enumerate(splitter.split(np.zeros(len(X)), y)):
+                fold[test] = k
+            np.save(os.path.join(self.path, "fold.npy"), fold)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        _attached.pop(self.path, None)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(path):
+    """
+    function which memory-maps the arrays of a shared dataset,
+    once per process and dataset.
+
+    Returns
+    -------
+    (X, y, fold) copy-on-write numpy arrays
+
+    """
+    if path not in _attached:
+        # the arrays of the previous datasets are released, their files are removed
+        _attached.clear()
+        _attached[path] = tuple(np.load(os.path.join(path, name + ".npy"), mmap_mode="c") for name in ["X", "y", "fold"])
+    return _attached[path]
+
+
+def fold_score(path, estimator, params, k, scoring):
+    """
+    function which fits a candidate on every fold but the k-th of a
+    shared dataset and returns its score on the k-th fold.
+
+    Returns
+    -------
+    float
+
+    """
+    X, y, fold = attach(path)
+    is_test = fold == k
+    model = clone(estimator).set_params(**params)
+    if has_fit_parameter(model, "sample_weight"):
+        # the model is fitted on the memory-mapped matrix, the test rows having
+        # a weight of 0, instead of a copy of the training rows in each worker.
+        # The sklearn trees ignore the rows with a zero weight, the fit is
+        # the one on the training rows alone (same scores as cross_val_score)
+        model.fit(X, y, sample_weight=(~is_test).astype(np.float64))
+    else:
+        model.fit(X[~is_test], y[~is_test])
+    return float(get_scorer(scoring)(model, X[is_test], y[is_test]))
@@ -6,30 +6,50 @@ Created on Mon Oct 17 16:11:04 2022
 @author: fatima-zahrabanani
 """
 
-from sklearn.tree import DecisionTreeClassifier, export_graphviz, plot_tree, export_text
+from sklearn.tree import DecisionTreeClassifier, export_text
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
-from sklearn.model_selection import GridSearchCV
-import matplotlib.pyplot as plt
-import pickle
 import os 
-import pandas as pd
-import shap
+from src.data.storage import Storage
+from src.instrumentation import step
+from src.features.build_features import Encoders
+from src.models.tree_inference import export_tree
+from src.models.model_bundle import write_bundle, BUNDLE_FILE
+from src.models.hyperparameter_search import ScoreCache, make_search, SCORES_FILE, data_fingerprint
+from src.models.explanations import ShapStore, stratified_sample, compute_shap_values
+from src.models.histogram_tree import HistogramTree, hash_split
+
+# parameters of the out-of-core tree, which trains a single candidate
+OUT_OF_CORE_PARAMS = {'max_depth': 3, 'min_samples_leaf': 7, 'criterion': "gini"}
 
 class Train:
     """
     class containing methods for training the ML model
     """
     
-    def __init__(self,project_dir,features,target,target_names,test_size,params= None):
+    def __init__(self,project_dir,features,target,target_names,test_size,params= None,storage= None,search= "grid",shap_rows= 10000,shap_chunksize= 10000,shap_workers= 1,out_of_core= False,chunksize= 100000,max_bins= 64,id_column= "ID",baseline= False):
         self.project_dir = project_dir
-        csvFile = os.path.join(self.project_dir,"data","processed.csv")
-        self.data = pd.read_csv(csvFile)
+        # storage of the processed dataset
+        # if not specified the dataset is read from data/processed.csv
+        self.storage = storage if storage != None else Storage(self.project_dir)
+        # out-of-core mode: the processed dataset is never loaded whole, it is read 
+        # by chunks of chunksize rows, split by the hash of id_column and the tree
+        # is grown from histograms of at most max_bins bins per feature
+        # with baseline, the in-memory sklearn tree is trained on the same split to compare the accuracies
+        self.out_of_core = out_of_core
+        self.chunksize = chunksize
+        self.max_bins = max_bins
+        self.id_column = id_column
+        self.baseline = baseline
+        # only the columns used for training are read
+        self.data = self.storage.read("processed", columns = features + [target]) if not out_of_core else None
         self.train = None
         self.test = None
         self.target = target
         self.features = features
-        if params == None:
+        if params == None and out_of_core:
+            self.params = dict(OUT_OF_CORE_PARAMS)
+        elif params == None:
             self.params = {
                 'max_depth': [2, 3],
                 'min_samples_leaf': [3, 5, 7],
@@ -40,32 +60,131 @@ class Train:
         self.model = None
         self.test_size = test_size
         self.target_names = target_names
+        # strategy of the hyperparameter search: "grid", "halving" or an object with a search method
+        # the cross-validation scores are cached in models/cv_scores.json
+        self.search = search
+        # SHAP values are computed on a stratified sample of shap_rows training rows (None -> all rows)
+        # by chunks of shap_chunksize rows in shap_workers processes
+        self.shap_rows = shap_rows
+        self.shap_chunksize = shap_chunksize
+        self.shap_workers = shap_workers
+        self.shap_store = ShapStore(self.project_dir)
+        # metrics and parameters of the trained model, stored in its bundle
+        self.metrics = dict()
+        self.best_params = None
     
+    @step("train.split_data", rows="data")
     def split_data(self,test_size):
         self.train, self.test = train_test_split(self.data, test_size= test_size, random_state=1)
         
+    @step("train.hyperparameter_tuning", rows="train")
     def hyperparameter_tuning_training(self):
         dt = DecisionTreeClassifier(random_state=99)
-        grid_search = GridSearchCV(estimator=dt, 
-                           param_grid=self.params, 
-                           cv=4, n_jobs=-1, verbose=1, scoring = "accuracy")
-        grid_search.fit(self.train[self.features], self.train[self.target])
-        self.model = grid_search.best_estimator_
+        cache = ScoreCache(os.path.join(self.project_dir,"models",SCORES_FILE))
+        search = make_search(self.search, cv=4, scoring="accuracy", cache=cache)
+        best_params, best_score = search.search(dt, self.params, self.train[self.features], self.train[self.target])
+        print("Best parameters:", best_params, "cross-validation accuracy:", best_score)
+        self.best_params = best_params
+        self.metrics["cv_accuracy"] = float(best_score)
+        # the best candidate is refitted on the whole training data
+        self.model = dt.set_params(**best_params).fit(self.train[self.features], self.train[self.target])
     
      
         
+    @step("train.start_training", rows="data")
     def start_training(self):
+        if self.out_of_core:
+            self.start_out_of_core_training()
+            return
         self.split_data(self.test_size)
         self.hyperparameter_tuning_training()
         self.plot_tree()
         self.shap_values()
         self.accuracy()
         # save the model to disk
-        filename = os.path.join(self.project_dir,"models",'trained_model.sav')
-        pickle.dump(self.model, open(filename, 'wb'))
+        self.export_tree()
+
+    @step("train.export_tree", rows="test")
+    def export_tree(self):
+        """
+        function which saves the model in models/model.bundle: the arrays of 
+        the tree, evaluated without sklearn at prediction time, with the 
+        encoders of the features, the fingerprint of the training data, 
+        the metrics and the parameters of the model.
+        The predictions of the exported tree are checked against the model 
+        on the test data.
+
+        Returns
+        -------
+        None.
+
+        """
+        compiled = export_tree(self.model, features = self.features, X_check = self.test[self.features])
+        encodersPath = os.path.join(self.project_dir,"models","encoders.json")
+        encoders = Encoders.load(encodersPath) if os.path.exists(encodersPath) else None
+        write_bundle(os.path.join(self.project_dir,"models",BUNDLE_FILE), compiled, encoders = encoders,
+                     metrics = self.metrics, params = self.best_params, target = self.target, target_classes = self.target_names,
+                     data_fingerprint = data_fingerprint(self.train[self.features], self.train[self.target]))
         
+    def read_chunks(self):
+        # new iterator over the chunks of the processed dataset, one per pass
+        return self.storage.read_chunks("processed", columns = [self.id_column] + self.features + [self.target], chunksize = self.chunksize)
+
+    @step("train.out_of_core")
+    def start_out_of_core_training(self):
+        """
+        function which trains a HistogramTree on the processed dataset read 
+        by chunks, reports its accuracy on the test rows (and the one of the 
+        in-memory sklearn tree if self.baseline) and saves it in models/model.bundle.
+
+        Returns
+        -------
+        None.
+
+        """
+        if any(isinstance(value, (list, tuple)) for value in self.params.values()):
+            raise ValueError("The out-of-core training takes one value per parameter, not a grid: {}".format(self.params))
+        histogramTree = HistogramTree(max_bins = self.max_bins, test_size = self.test_size, seed = 1, **self.params)
+        compiled = histogramTree.fit(self.read_chunks, self.features, self.target, self.id_column)
+        accuracy, n_test = histogramTree.score(self.read_chunks, self.features, self.target, self.id_column)
+        print("Out-of-core tree trained on {} rows with {} passes, accuracy on the {} test rows: {}".format(
+              histogramTree.n_train, histogramTree.n_passes, n_test, accuracy))
+        self.metrics["test_accuracy"] = float(accuracy)
+        if self.baseline:
+            self.metrics["baseline_test_accuracy"] = float(self.baseline_accuracy())
+        self.best_params = self.params
+
+        encodersPath = os.path.join(self.project_dir,"models","encoders.json")
+        encoders = Encoders.load(encodersPath) if os.path.exists(encodersPath) else None
+        write_bundle(os.path.join(self.project_dir,"models",BUNDLE_FILE), compiled, encoders = encoders,
+                     metrics = self.metrics, params = self.best_params, target = self.target, target_classes = self.target_names,
+                     data_fingerprint = histogramTree.fingerprint)
+
+    @step("train.baseline")
+    def baseline_accuracy(self):
+        """
+        function which trains the in-memory sklearn tree with the same 
+        parameters on the same hashed split, the whole dataset is loaded.
+
+        Returns
+        -------
+        float
+            Accuracy on the test rows.
+
+        """
+        data = self.storage.read("processed", columns = [self.id_column] + self.features + [self.target])
+        is_test = hash_split(data[self.id_column], self.test_size, 1)
+        train, test = data[~is_test], data[is_test]
+        model = DecisionTreeClassifier(random_state=99, **self.params).fit(train[self.features], train[self.target])
+        accuracy = accuracy_score(test[self.target], model.predict(test[self.features]))
+        print("Accuracy of the in-memory DecisionTreeClassifier on the same test rows: ", accuracy)
+        return accuracy
+
+    @step("train.plot_tree")
     def plot_tree(self):
         
+        import matplotlib.pyplot as plt
+        from sklearn.tree import plot_tree
         fig = plt.figure(figsize=(50,35))
         _ = plot_tree(self.model,
                    feature_names=self.features,
@@ -76,15 +195,44 @@ class Train:
         
         
     def shap_values(self):
+        import shap
+        import matplotlib.pyplot as plt
+        values, X = self.compute_shap_values()
         fig = plt.figure(figsize=(25,20))
-        explainer = shap.TreeExplainer(self.model)
-        shap_values = explainer.shap_values(self.train[self.features])
-        shap.summary_plot(shap_values,feature_names=self.features,class_inds=[1])
+        shap.summary_plot([values[:, :, k] for k in range(values.shape[2])],feature_names=self.features,class_inds=[1])
+
+    @step("train.shap_values", rows="train")
+    def compute_shap_values(self):
+        """
+        function which returns the SHAP values of a stratified sample of the
+        training data. They are stored next to the model, keyed by its hash,
+        and reloaded instead of computed while the model and the sample
+        settings don't change.
+
+        Returns
+        -------
+        numpy array of shape (n_rows, n_features, n_classes), Pandas dataFrame of the explained rows
+
+        """
+        # an identical tree may be trained on other rows, the sample depends on them
+        settings = {"rows": self.shap_rows, "features": self.features, "n_train": len(self.train),
+                    "data": data_fingerprint(self.train[self.features], self.train[self.target])}
+        stored = self.shap_store.load(self.model, settings)
+        if stored != None:
+            print("Reusing the stored SHAP values of the model")
+            return stored
+        X = stratified_sample(self.train, self.target, self.shap_rows)[self.features]
+        values = compute_shap_values(self.model, X, self.shap_chunksize, self.shap_workers)
+        self.shap_store.save(self.model, values, X, settings)
+        return values, X
         
+    @step("train.accuracy", rows="test")
     def accuracy(self):
         y_pred = self.model.predict(self.test[self.features])
         accuracy = accuracy_score(self.test[self.target],y_pred)
         print("The accuracy of the model on the test data is: ",accuracy)
+        self.metrics["test_accuracy"] = float(accuracy)
+        return accuracy
         
     
         
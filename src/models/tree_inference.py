@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Nov  8 11:34:20 2022
+
+@author: fatima-zahrabanani
+"""
+import numpy as np
+
+
+class CompiledTree:
+    """
+    class evaluating a decision tree stored as flat arrays, with numpy only
+    (no sklearn import and no unpickling at prediction time).
+    Node i splits on feature[i] <= threshold[i] towards left[i] or right[i],
+    leaves have left[i] == right[i] == -1 and predict the class with the
+    highest value[i]. A missing value goes left if missing_left[i] is
+    true (missing_go_to_left of sklearn), right otherwise.
+    """
+    def __init__(self, feature, threshold, left, right, value, classes, features = None, max_depth = None, missing_left = None):
+        self.feature = np.asarray(feature)
+        self.threshold = np.asarray(threshold)
+        self.left = np.asarray(left)
+        self.right = np.asarray(right)
+        self.value = np.asarray(value)
+        self.classes = np.asarray(classes)
+        # by default the missing values go right, like a failed threshold comparison
+        self.missing_left = np.asarray(missing_left, dtype=bool) if missing_left is not None else np.zeros(len(self.left), dtype=bool)
+        # names of the features, in the order of the columns of X
+        self.features = list(features) if features is not None else None
+        self.leaf_class = self.classes[np.argmax(self.value, axis=1)]
+        # the depth stored with the tree avoids walking its nodes when loading it
+        self.max_depth = max_depth if max_depth != None else self.depth()
+
+    def depth(self):
+        depth = np.zeros(len(self.left), dtype=np.int64)
+        # children always have a higher index than their parent
+        for node in range(len(self.left)):
+            if self.left[node] != -1:
+                depth[self.left[node]] = depth[self.right[node]] = depth[node] + 1
+        return int(depth.max())
+
+    def apply(self, X):
+        """
+        function which returns the leaf reached by each row. All the rows
+        go down the tree together, one level per iteration.
+
+        Parameters
+        ----------
+        X : array-like of shape (n_rows, n_features)
+            Features in the order of self.features.
+
+        Returns
+        -------
+        numpy array of leaf indices
+
+        """
+        # same precision as sklearn, which compares float32 features to the thresholds
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))
+        node = np.zeros(len(X), dtype=np.int64)
+        for _ in range(self.max_depth):
+            left = self.left[node]
+            is_split = left != -1
+            values = X[rows, np.maximum(self.feature[node], 0)]
+            go_left = (values <= self.threshold[node]) | (np.isnan(values) & self.missing_left[node])
+            node = np.where(is_split, np.where(go_left, left, self.right[node]), node)
+        return node
+
+    def predict(self, X):
+        return self.leaf_class[self.apply(X)]
+
+    def predict_proba(self, X):
+        value = self.value[self.apply(X)]
+        return value/value.sum(axis=1, keepdims=True)
+
+    def save(self, path):
+        np.savez(path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                 value=self.value, classes=self.classes, missing_left=self.missing_left,
+                 features=np.array(self.features if self.features is not None else [], dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            features = arrays["features"].tolist() or None
+            return cls(arrays["feature"], arrays["threshold"], arrays["left"], arrays["right"],
+                       arrays["value"], arrays["classes"], features,
+                       missing_left = arrays["missing_left"] if "missing_left" in arrays.files else None)
+
+
+def export_tree(model, features = None, X_check = None):
+    """
+    function which turns a fitted sklearn DecisionTreeClassifier into a CompiledTree.
+
+    Parameters
+    ----------
+    model : DecisionTreeClassifier
+        Fitted single-output tree.
+    features : list, optional
+        Names of the features.
+    X_check : array-like, optional
+        Rows on which the predictions of the compiled tree are checked
+        against model.predict.
+
+    Returns
+    -------
+    CompiledTree
+
+    """
+    tree = model.tree_
+    # the side of the missing values of each split (sklearn >= 1.3), chosen
+    # when fitting even if the training data had no missing values
+    missing_left = getattr(tree, "missing_go_to_left", None)
+    compiled = CompiledTree(tree.feature.astype(np.int32), tree.threshold,
+                            tree.children_left.astype(np.int32), tree.children_right.astype(np.int32),
+                            tree.value[:, 0, :], model.classes_, features, missing_left = missing_left)
+    if X_check is not None:
+        check_parity(model, compiled, X_check)
+    return compiled
+
+
+def check_parity(model, compiled, X):
+    """
+    function which checks that the compiled tree predicts the same classes
+    as the sklearn model.
+
+    Raises
+    ------
+    AssertionError if at least one prediction differs.
+
+    """
+    expected = model.predict(X)
+    predicted = compiled.predict(np.asarray(X))
+    different = int((expected != predicted).sum())
+    if different > 0:
+        raise AssertionError("The compiled tree differs from the model on {} rows out of {}".format(different, len(expected)))
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Nov  2 10:47:29 2022
+
+@author: fatima-zahrabanani
+"""
+from src.data.storage import Storage
+from src.instrumentation import instrument
+import hashlib
+import json
+import os
+
+# name of the file, inside the project directory, where the fingerprints of the stages are stored
+MANIFEST_FILE = ".pipeline_cache.json"
+
+# stages of the workflow in their execution order
+STAGES = ["clean", "features", "train"]
+
+
+class Pipeline:
+    """
+    class running the stages of the workflow (clean -> features -> train).
+    Each stage is fingerprinted by the hash of its input files, its parameters
+    and the source code it runs. A stage whose fingerprint didn't change
+    since its last run is skipped and its stored outputs are reused.
+    """
+    def __init__(self, project_dir, storage = None, clean_params = None, features_params = None, train_params = None, code_version = None, exchange_rates = None, instrumentation = None):
+        self.project_dir = project_dir
+        self.storage = storage if storage != None else Storage(self.project_dir)
+
+        # store of exchange rates given to MakeDataset, its csvFile is an input of the clean stage
+        self.exchange_rates = exchange_rates
+
+        # parameters of MakeDataset (json serializable, they are part of the fingerprint)
+        self.clean_params = {"missing_values_percent": 85}
+        self.clean_params.update(clean_params or dict())
+
+        # parameters of the feature engineering
+        self.features_params = {"outliers": ["backers"],
+                                "columns_to_keep": ["ID","state","main_category","currency","goal","campaign_period"],
+                                "categorical": ["main_category","currency"],
+                                "target": "state"}
+        self.features_params.update(features_params or dict())
+
+        # parameters of Train
+        self.train_params = {"features": ["main_category","goal","currency","campaign_period"],
+                             "target": "state",
+                             "target_names": ["failed","successful"],
+                             "test_size": 0.25,
+                             "params": None,
+                             "search": "grid"}
+        self.train_params.update(train_params or dict())
+
+        # extra version added to the fingerprints, changing it re-runs every stage
+        self.code_version = code_version
+        
+        # sink of the instrumentation records of the stages (json lines file or function)
+        # if not specified the stages are not instrumented
+        self.instrumentation = instrumentation
+
+        self.manifestPath = os.path.join(self.project_dir, MANIFEST_FILE)
+        self.manifest = self.read_manifest()
+
+    def read_manifest(self):
+        try:
+            with open(self.manifestPath, 'r') as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return {"stages": dict(), "files": dict()}
+
+    def write_manifest(self):
+        with open(self.manifestPath, 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=2)
+
+    def file_hash(self, path):
+        """
+        function which returns the sha256 of a file. The hash is stored in the
+        manifest with the modification time and size of the file so that an
+        unchanged file is not read again.
+
+        Parameters
+        ----------
+        path : str
+            path of the file.
+
+        Returns
+        -------
+        str
+            Hash of the file, None if it doesn't exist.
+
+        """
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        signature = [stat.st_mtime_ns, stat.st_size]
+        stored = self.manifest["files"].get(path)
+        if stored != None and stored["signature"] == signature:
+            return stored["sha256"]
+
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                sha256.update(block)
+        self.manifest["files"][path] = {"signature": signature, "sha256": sha256.hexdigest()}
+        return sha256.hexdigest()
+
+    def stage_definition(self, stage):
+        """
+        function which returns the inputs, outputs, parameters and
+        source files of a stage.
+
+        Parameters
+        ----------
+        stage : str
+            "clean", "features" or "train".
+
+        Returns
+        -------
+        dictionary
+
+        """
+        src_dir = os.path.dirname(os.path.abspath(__file__))
+        if stage == "clean":
+            rates = self.exchange_rates.csvPath if self.exchange_rates != None else os.path.join(self.project_dir,"data","exchange_rates.csv")
+            # options of the categorical columns (see references.load_options)
+            referencesDir = os.path.join(self.project_dir,"references")
+            references = [os.path.join(referencesDir,file) for file in sorted(os.listdir(referencesDir)) if file.endswith(".txt")] if os.path.isdir(referencesDir) else []
+            return {"inputs": [os.path.join(self.project_dir,"data","original.csv"), rates] + references,
+                    "outputs": [self.storage.path("clean")],
+                    "params": self.clean_params,
+                    "code": [os.path.join(src_dir,"data",file) for file in sorted(os.listdir(os.path.join(src_dir,"data"))) if file.endswith(".py")]}
+        if stage == "features":
+            return {"inputs": [self.storage.path("clean")],
+                    "outputs": [self.storage.path("processed"), os.path.join(self.project_dir,"models","encoders.json")],
+                    "params": self.features_params,
+                    "code": [os.path.join(src_dir,"features",file) for file in ["build_features.py","quantile_sketch.py"]] + [os.path.join(src_dir,"data","storage.py")]}
+        if stage == "train":
+            # the encoders are written in the bundle
+            return {"inputs": [self.storage.path("processed"), os.path.join(self.project_dir,"models","encoders.json")],
+                    "outputs": [os.path.join(self.project_dir,"models","model.bundle")],
+                    "params": self.train_params,
+                    "code": [os.path.join(src_dir,"models",file) for file in ["train_model.py","hyperparameter_search.py","shared_dataset.py","tree_inference.py","model_bundle.py","histogram_tree.py","explanations.py"]] + [os.path.join(src_dir,"data","storage.py")]}
+        raise ValueError("Unknown stage {}, expected one of {}".format(stage, STAGES))
+
+    def fingerprint(self, stage):
+        """
+        function which fingerprints a stage with the hash of its inputs,
+        its parameters and its source code.
+
+        Returns
+        -------
+        str
+
+        """
+        definition = self.stage_definition(stage)
+        content = {"inputs": [self.file_hash(path) for path in definition["inputs"]],
+                   "params": definition["params"],
+                   "code": [self.file_hash(path) for path in definition["code"]],
+                   "code_version": self.code_version,
+                   "storage": self.storage.file_format}
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def is_cached(self, stage, fingerprint):
+        """
+        function which checks if the stored outputs of a stage can be reused:
+        same fingerprint and outputs not modified since the stage ran.
+
+        Returns
+        -------
+        bool
+
+        """
+        stored = self.manifest["stages"].get(stage)
+        if stored == None or stored["fingerprint"] != fingerprint:
+            return False
+        outputs = self.stage_definition(stage)["outputs"]
+        return [self.file_hash(path) for path in outputs] == stored["outputs"]
+
+    def run_clean(self):
+        from src.data.make_dataset import MakeDataset
+        makeData = MakeDataset(self.project_dir, storage = self.storage, exchange_rates = self.exchange_rates, **self.clean_params)
+        makeData.clean_dataset()
+
+    def run_features(self):
+        from src.features.build_features import BuildFeatures
+        params = self.features_params
+        buildFeatures = BuildFeatures(self.storage.read("clean"), self.project_dir, storage = self.storage)
+        for column in params["outliers"]:
+            buildFeatures.drop_outliers(column)
+        buildFeatures.drop_unused_columns(columns_to_keep = params["columns_to_keep"])
+        buildFeatures.target_encoding(params["target"])
+        buildFeatures.feature_encoding(columns = params["categorical"])
+        buildFeatures.save_features()
+
+    def run_train(self):
+        from src.models.train_model import Train
+        train = Train(project_dir = self.project_dir, storage = self.storage, **self.train_params)
+        train.start_training()
+
+    def run(self, stages = None, force = False):
+        """
+        function which runs the stages of the workflow, skipping the ones
+        whose fingerprint didn't change. Since the fingerprint of a stage
+        contains the hash of its inputs, the stages after a re-run stage
+        are only re-run if its outputs changed.
+
+        Parameters
+        ----------
+        stages : list, optional
+            Stages to run. The default is all the stages.
+        force : bool, optional
+            Run the stages even if their fingerprint didn't change. The default is False.
+
+        Returns
+        -------
+        dictionary
+            stage -> "ran" or "cached"
+
+        """
+        if self.instrumentation != None:
+            with instrument(self.instrumentation):
+                return self.run_stages(stages, force)
+        return self.run_stages(stages, force)
+
+    def run_stages(self, stages = None, force = False):
+        stages = STAGES if stages == None else stages
+        status = dict()
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            fingerprint = self.fingerprint(stage)
+            if not force and self.is_cached(stage, fingerprint):
+                print("Stage {} is up to date, reusing its outputs".format(stage))
+                status[stage] = "cached"
+                continue
+
+            getattr(self, "run_"+stage)()
+            # the inputs may change while the stage runs (e.g. imported exchange rates)
+            fingerprint = self.fingerprint(stage)
+            outputs = self.stage_definition(stage)["outputs"]
+            self.manifest["stages"][stage] = {"fingerprint": fingerprint,
+                                              "outputs": [self.file_hash(path) for path in outputs]}
+            self.write_manifest()
+            status[stage] = "ran"
+        return status
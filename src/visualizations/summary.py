@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Nov 14 09:52:17 2022
+
+@author: fatima-zahrabanani
+"""
+import pandas as pd
+import numpy as np
+
+
+class SummaryCube:
+    """
+    class computing, in one pass over each column of the clean data, the
+    small aggregates drawn by Visualize:
+        - counts of the target classes per value (categorical columns)
+        - counts of the target classes per histogram bin and a fine
+          histogram for the density (float columns)
+        - box plot statistics per target class (numerical columns)
+    The plots then never read the raw rows again.
+    """
+    def __init__(self, df, target = "state", nbins = 10, density_bins = 100):
+        self.df = df
+        self.target = target
+        # bins of the bivariate plots of float columns
+        self.nbins = nbins
+        # bins of the density of the univariate plots
+        self.density_bins = density_bins
+        # column -> dictionary of aggregates
+        self.summaries = dict()
+        # classes of the target in their order of appearance, like seaborn
+        if df is not None:
+            self.target_codes, self.classes = pd.factorize(df[target])
+
+    def build(self, columns):
+        """
+        function which computes the aggregates of several columns.
+
+        Returns
+        -------
+        None.
+
+        """
+        for column in columns:
+            self.summary(column)
+
+    def subset(self, columns):
+        """
+        function which returns a cube holding only the aggregates of
+        some columns and no rows (e.g. to send it to a worker process).
+
+        Returns
+        -------
+        SummaryCube
+
+        """
+        for column in columns:
+            if column not in self.summaries:
+                self.summary(column)
+        cube = SummaryCube(None, self.target, self.nbins, self.density_bins)
+        cube.classes = self.classes
+        # copies, a later call with other bins doesn't change the subset
+        cube.summaries = {column: dict(self.summaries[column]) for column in columns}
+        return cube
+
+    def summary(self, column, nbins = None):
+        """
+        function which returns the aggregates of a column, computed on the
+        first call. A number of bins other than self.nbins only recomputes
+        the bivariate histogram.
+
+        Parameters
+        ----------
+        column : str
+            Column name.
+        nbins : int, optional
+            Bins of the bivariate histogram. The default is self.nbins.
+
+        Returns
+        -------
+        dictionary
+
+        """
+        nbins = self.nbins if nbins == None else nbins
+        if column not in self.summaries:
+            self.summaries[column] = self.compute(column, nbins)
+        elif self.summaries[column].get("nbins", nbins) != nbins:
+            values = self.df[column].to_numpy(dtype=float, na_value=np.nan)
+            self.summaries[column].update(self.state_histogram(values, nbins))
+        return self.summaries[column]
+
+    def class_counts(self, codes, n_values):
+        # counts of each (value, class) pair with one bincount
+        n_classes = len(self.classes)
+        valid = (codes >= 0) & (self.target_codes >= 0)
+        counts = np.bincount(codes[valid]*n_classes + self.target_codes[valid], minlength=n_values*n_classes)
+        return counts.reshape(n_values, n_classes)
+
+    def state_histogram(self, values, nbins):
+        mini, maxi = np.nanmin(values), np.nanmax(values)
+        edges = np.linspace(mini, maxi, num=nbins+1)
+        # same bins as numpy.histogram, the last one includes the maximum
+        codes = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, nbins - 1)
+        codes[np.isnan(values)] = -1
+        counts = pd.DataFrame(self.class_counts(codes, nbins), index=edges[:-1], columns=self.classes)
+        return {"nbins": nbins, "edges": edges, "counts": counts}
+
+    def box_statistics(self, values):
+        # statistics of matplotlib.cbook.boxplot_stats for each class, without the outliers
+        statistics = []
+        for code, label in enumerate(self.classes):
+            class_values = values[(self.target_codes == code) & ~np.isnan(values)]
+            if len(class_values) == 0:
+                statistics.append({"label": label, "med": np.nan, "q1": np.nan, "q3": np.nan,
+                                   "mean": np.nan, "whislo": np.nan, "whishi": np.nan, "fliers": []})
+                continue
+            q1, med, q3 = np.percentile(class_values, [25, 50, 75])
+            iqr = q3 - q1
+            whislo = class_values[class_values >= q1 - 1.5*iqr].min()
+            whishi = class_values[class_values <= q3 + 1.5*iqr].max()
+            statistics.append({"label": label, "med": med, "q1": q1, "q3": q3, "mean": class_values.mean(),
+                               "whislo": whislo, "whishi": whishi, "fliers": []})
+        return statistics
+
+    def compute(self, column, nbins):
+        series = self.df[column]
+        # the float columns of any width (float32 in typed mode) are binned,
+        # the other columns (integers included) are counted by value
+        continuous = pd.api.types.is_float_dtype(series)
+        numerical = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        summary = {"dtype": str(series.dtype), "continuous": continuous}
+        if continuous:
+            values = series.to_numpy(dtype=float, na_value=np.nan)
+            summary.update(self.state_histogram(values, nbins))
+            density, density_edges = np.histogram(values[~np.isnan(values)], bins=self.density_bins)
+            summary["density"] = density
+            summary["density_edges"] = density_edges
+        else:
+            if pd.api.types.is_datetime64_any_dtype(series):
+                series = series.dt.strftime('%b')
+            # values in their order of appearance, like seaborn
+            codes, values = pd.factorize(series)
+            summary["counts"] = pd.DataFrame(self.class_counts(codes, len(values)), index=values, columns=self.classes)
+
+        if numerical:
+            summary["box"] = self.box_statistics(series.to_numpy(dtype=float, na_value=np.nan))
+        return summary
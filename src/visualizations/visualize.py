@@ -5,23 +5,49 @@ Created on Mon Oct 17 16:11:48 2022
 
 @author: fatima-zahrabanani
 """
-import seaborn as sns
-sns.set_theme(style='darkgrid')
-import plotly.express as px
 import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
+from src.visualizations.summary import SummaryCube
+import src.visualizations.summary as summary_module
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
 import os
 
+# name of the file, inside the figures folder, storing the fingerprints of the rendered figures
+FIGURES_MANIFEST = ".figures_cache.json"
+
+# plot type -> end of the name of its image file
+PLOT_TYPES = {"univariate": "_univariate.png", "box": "_box.png", "bivariate": "_bivariate.png"}
+
+# plotting libraries, imported by load_plotting on the first plot
+sns = None
+plt = None
+px = None
+
+
+def load_plotting():
+    # seaborn, matplotlib and plotly take seconds to import, only the plots need them
+    global sns, plt, px
+    if sns == None:
+        import seaborn
+        import matplotlib.pyplot
+        import plotly.express
+        seaborn.set_theme(style='darkgrid')
+        sns, plt, px = seaborn, matplotlib.pyplot, plotly.express
+
 class Visualize:
     """
     class containing methods to visualize the data inside the dataFrame
     """
     
-    def __init__(self,df,project_dir):
+    def __init__(self,df,project_dir,show = True,summary = None):
         self.df = df
+        # aggregates drawn by the plots, computed once per column from df
+        self.summary = summary if summary != None else SummaryCube(df)
         self.project_dir = project_dir
         self.figures_dir = os.path.join(self.project_dir,"report","figures")
+        # if False the plotly figures are only written to the figures folder
+        self.show = show
         
         
     def univariate_plot(self,column):
@@ -38,10 +64,20 @@ class Visualize:
         None.
 
         """
-        if self.df[column].dtype == "float64":
-            chart = sns.kdeplot(self.df[column])
+        load_plotting()
+        summary = self.summary.summary(column)
+        if summary["continuous"]:
+            # density estimated from the fine histogram of the column
+            edges = summary["density_edges"]
+            chart = sns.kdeplot(x=(edges[:-1] + edges[1:])/2, weights=summary["density"])
+            chart.set_xlabel(column)
         else:
-            chart = sns.countplot(x =column, data = self.df, palette = "Set2")
+            counts = summary["counts"].sum(axis=1)
+            if pd.api.types.is_numeric_dtype(counts.index):
+                counts = counts.sort_index()
+            chart = sns.barplot(x=counts.index.astype(str), y=counts.to_numpy(), palette = "Set2")
+            chart.set_xlabel(column)
+            chart.set_ylabel("count")
             chart.set_xticklabels(chart.get_xticklabels(), rotation=45, horizontalalignment='right')
         imageFile = os.path.join(self.figures_dir,column+'_univariate.png')
         plt.savefig(imageFile)
@@ -60,7 +96,21 @@ class Visualize:
         None.
 
         """
-        sns.boxplot(data=self.df, x=column, y="state", palette="Blues",showmeans=True)
+        load_plotting()
+        statistics = self.summary.summary(column)["box"]
+        ax = plt.gca()
+        # boxes drawn from the quantiles of each state, the outliers are not drawn
+        try:
+            boxes = ax.bxp(statistics, orientation="horizontal", showmeans=True, showfliers=False, patch_artist=True)
+        except TypeError:
+            # matplotlib < 3.10
+            boxes = ax.bxp(statistics, vert=False, showmeans=True, showfliers=False, patch_artist=True)
+        for box, color in zip(boxes["boxes"], sns.color_palette("Blues", len(statistics))):
+            box.set_facecolor(color)
+        # first state on top, like seaborn
+        ax.invert_yaxis()
+        ax.set_xlabel(column)
+        ax.set_ylabel("state")
         imageFile = os.path.join(self.figures_dir,column+'_box.png')
         plt.savefig(imageFile)
         
@@ -80,28 +130,207 @@ class Visualize:
         None.
 
         """
-        if self.df[column].dtype == "float64": 
-            mini = self.df[column].min()
-            maxi = self.df[column].max()
-            bins = np.linspace(mini, maxi, num=nbins+1)
-            labels = [mini+(i/nbins)*maxi-mini for i in range(nbins)]
-            self.df['binned'] = pd.cut(self.df[column], bins=bins, labels=labels)
-            df_grouped = self.df.groupby('binned')["state"].value_counts(normalize=True).unstack("state")
+        fig = self.bivariate_figure(column, nbins)
+        if self.show:
+            fig.show()
+        imageFile = os.path.join(self.figures_dir,column+'_bivariate.png')
+        fig.write_image(imageFile)
         
-        # ToDo : try to fix the problem
-        elif self.df[column].dtype == "datetime64": 
-            self.df['month'] = self.df[column].dt.strftime('%b')
-            df_grouped = self.df.groupby('month')["state"].value_counts(normalize=True).unstack("state")
-            
-        else:
-            df_grouped = self.df.groupby(column)["state"].value_counts(normalize=True).unstack("state")
+    def bivariate_figure(self,column,nbins = None):
+        """
+        function which creates the plotly figure of bivariate_plot.
+
+        Parameters
+        ----------
+        column : str
+            Column name.
+        nbins: int
+            Number of bins if the column is numerical
+
+        Returns
+        -------
+        plotly figure
+
+        """
+        # counts of each state per value, per month for dates, per bin (labelled by
+        # its lower edge) for numerical columns
+        load_plotting()
+        summary = self.summary.summary(column, nbins)
+        counts = summary["counts"]
+        totals = counts.sum(axis=1)
+        df_grouped = counts[totals > 0].div(totals[totals > 0], axis=0)
+        if not summary["continuous"]:
+            df_grouped = df_grouped.sort_index()
         
         df_grouped[column] = df_grouped.index
         
         fig = px.bar(df_grouped,  x=["successful", "failed"],y=column)
-        fig.show()
-        imageFile = os.path.join(self.figures_dir,column+'_bivariate.png')
-        fig.write_image(imageFile)
-        
+        return fig
+    
+    def figure_fingerprint(self, plot_type, column, kwargs):
+        """
+        function which fingerprints a figure by the data it draws, its
+        parameters and the code of this module and of the summary cube.
 
+        Returns
+        -------
+        str
+
+        """
+        sha256 = hashlib.sha256()
+        sha256.update(json.dumps([plot_type, column, kwargs], sort_keys=True, default=str).encode())
+        sha256.update(pd.util.hash_pandas_object(self.df[job_columns(plot_type, column)], index=False).to_numpy().tobytes())
+        # the figures are drawn from the aggregates of the summary cube
+        for codePath in [__file__, summary_module.__file__]:
+            with open(codePath, 'rb') as code_file:
+                sha256.update(code_file.read())
+        return sha256.hexdigest()
+    
+    def render_report(self, jobs, workers = None, force = False):
+        """
+        function which renders a set of figures in parallel processes, on the
+        non-interactive Agg backend. The plotly figures are exported together
+        at the end with one kaleido session. A figure whose data and
+        parameters didn't change since its last render is skipped.
+
+        Parameters
+        ----------
+        jobs : list
+            Tuples (plot type, column) or (plot type, column, dictionary of
+            parameters), plot type being "univariate", "box" or "bivariate".
+        workers : int, optional
+            Number of processes. The default is None, the number of CPUs.
+        force : bool, optional
+            Render the figures even if they didn't change. The default is False.
+
+        Returns
+        -------
+        dictionary
+            image file -> "rendered", "skipped" or "failed"
+
+        """
+        manifestPath = os.path.join(self.figures_dir,FIGURES_MANIFEST)
+        try:
+            with open(manifestPath, 'r') as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            manifest = dict()
         
+        status = dict()
+        to_render = []
+        for job in jobs:
+            plot_type, column = job[0], job[1]
+            kwargs = job[2] if len(job) > 2 else dict()
+            if plot_type not in PLOT_TYPES:
+                raise ValueError("Unknown plot type {}, expected one of {}".format(plot_type, list(PLOT_TYPES)))
+            imageFile = os.path.join(self.figures_dir,column+PLOT_TYPES[plot_type])
+            fingerprint = self.figure_fingerprint(plot_type, column, kwargs)
+            if not force and manifest.get(imageFile) == fingerprint and os.path.exists(imageFile):
+                status[imageFile] = "skipped"
+                continue
+            to_render.append((plot_type, column, kwargs, imageFile, fingerprint))
+        
+        # the manifest keeps the figures rendered before a failure or an interruption
+        rendered, failed = set(), dict()
+        os.makedirs(self.figures_dir, exist_ok=True)
+        try:
+            plotly_figures = []
+            if len(to_render) > 0:
+                with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+                    # the workers only receive the aggregates of their column
+                    futures = [executor.submit(render_job, self.job_summary(plot_type, column, kwargs), self.project_dir, plot_type, column, kwargs)
+                               for plot_type, column, kwargs, imageFile, fingerprint in to_render]
+                    for future, (plot_type, column, kwargs, imageFile, fingerprint) in zip(futures, to_render):
+                        try:
+                            figure = future.result()
+                        except Exception as error:
+                            failed[imageFile] = error
+                            continue
+                        if figure != None:
+                            plotly_figures.append((figure, imageFile))
+                        else:
+                            rendered.add(imageFile)
+            try:
+                write_plotly_images(plotly_figures)
+                rendered.update(imageFile for figure, imageFile in plotly_figures)
+            except Exception as error:
+                failed.update({imageFile: error for figure, imageFile in plotly_figures})
+        finally:
+            for plot_type, column, kwargs, imageFile, fingerprint in to_render:
+                if imageFile in rendered:
+                    manifest[imageFile] = fingerprint
+                    status[imageFile] = "rendered"
+                else:
+                    # rendered again by the next call
+                    manifest.pop(imageFile, None)
+                    status[imageFile] = "failed"
+                    if imageFile in failed:
+                        error = failed[imageFile]
+                        print("{} failed: {}: {}".format(os.path.basename(imageFile), type(error).__name__, str(error).strip().split("\n")[0]))
+            with open(manifestPath, 'w') as manifest_file:
+                json.dump(manifest, manifest_file, indent=2)
+        return status
+    
+    def job_summary(self, plot_type, column, kwargs):
+        if plot_type == "bivariate":
+            self.summary.summary(column, kwargs.get("nbins"))
+        return self.summary.subset([column])
+
+
+def job_columns(plot_type, column):
+    # columns read by a plot
+    return [column] if plot_type == "univariate" else [column, "state"]
+
+
+def init_worker():
+    # figures are only written to files
+    import matplotlib
+    matplotlib.use("Agg")
+    load_plotting()
+
+
+def render_job(summary, project_dir, plot_type, column, kwargs):
+    """
+    function run in a worker process which renders one figure.
+    The matplotlib figures are written by the worker, the plotly
+    figures are returned to be exported by the parent process.
+
+    Returns
+    -------
+    plotly figure as json, None for matplotlib figures
+
+    """
+    visualize = Visualize(None, project_dir, show = False, summary = summary)
+    if plot_type == "bivariate":
+        return visualize.bivariate_figure(column, **kwargs).to_json()
+    # every figure starts from an empty canvas
+    plt.figure()
+    getattr(visualize, plot_type+"_plot")(column, **kwargs)
+    plt.close("all")
+    return None
+
+
+def write_plotly_images(figures):
+    """
+    function which exports plotly figures to images with one kaleido session.
+
+    Parameters
+    ----------
+    figures : list
+        Tuples (plotly figure as json, image file).
+
+    Returns
+    -------
+    None.
+
+    """
+    if len(figures) == 0:
+        return
+    import plotly.io as pio
+    figs = [pio.from_json(figure) for figure, imageFile in figures]
+    if hasattr(pio, "write_images"):
+        pio.write_images(figs, [imageFile for figure, imageFile in figures])
+    else:
+        # older plotly versions keep the kaleido process alive between calls
+        for fig, (figure, imageFile) in zip(figs, figures):
+            fig.write_image(imageFile)